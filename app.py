@@ -0,0 +1,228 @@
+"""The bot: dispatcher, background services and the polling, webhook and sharded modes. Run it with bot.py."""
+import time
+
+# Точка отсчёта для времени запуска: всё, что ниже, входит в холодный старт.
+STARTED = time.perf_counter()
+
+import logging
+from aiogram.types import Update
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(filename)s:%(lineno)d in %(funcName)s(): %(message)s"
+)
+
+from aiogram import Bot, Dispatcher
+import asyncio
+import signal
+from contextlib import asynccontextmanager
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import BotCommand
+
+from dotenv import load_dotenv
+from os import getenv
+
+# До импорта модулей проекта: они читают настройки из окружения при импорте.
+load_dotenv()
+
+from bot_handlers.start import start_router
+from bot_handlers.quiz import quiz_router
+from bot_handlers.stats import stats_router
+from bot_handlers.raiting import raiting_router
+from bot_handlers.admin.start import admin_router
+from bot_handlers.admin.stats import admin_stats_router
+from bot_handlers.admin.settings import admin_settings_router
+import database.db as db
+from database.fsm_storage import SQLiteStorage
+from database import admin_counters, quiz_store
+from middlewares.middlewares import MetricsMiddleware
+from middlewares.scheduler import GLOBAL_RATE, OutgoingScheduler
+# shards и webhook нужны только в своих режимах и импортируются там.
+from services import charts, metrics, question_bank
+from services.utils import create_http_session
+
+
+async def on_error(update: Update, exception: Exception):
+    logger = logging.getLogger("bot")
+    logger.exception("Unhandled exception: %s", exception)
+    # Попытка ответить пользователю информативно
+    try:
+        if hasattr(update, "message") and update.message:
+            await update.message.reply("Произошла ошибка. Попробуйте ещё раз позже.")
+        elif hasattr(update, "callback_query") and update.callback_query:
+            await update.callback_query.message.reply("Произошла ошибка. Попробуйте ещё раз позже.")
+    except Exception:
+        logger.exception("Failed to send error message to user.")
+    return True
+
+
+def create_dispatcher() -> Dispatcher:
+    """Build the dispatcher with FSM storage and all routers."""
+    dp = Dispatcher(storage=SQLiteStorage())
+    routers = (
+        admin_router, admin_stats_router, admin_settings_router,
+        quiz_router, start_router, stats_router, raiting_router,
+    )
+    metrics_middleware = MetricsMiddleware()
+    for router in routers:
+        router.message.middleware(metrics_middleware)
+        router.callback_query.middleware(metrics_middleware)
+        dp.include_router(router)
+
+    # dp.errors.register(on_error)
+    return dp
+
+
+TELEGRAM_API_URL = getenv('TELEGRAM_API_URL')
+
+COMMANDS = [
+    BotCommand(command="start", description="Запуск бота"),
+    BotCommand(command="quiz", description="Начать викторину"),
+    BotCommand(command="stats", description="Моя статистика"),
+    BotCommand(command="help", description="Помощь"),
+]
+
+
+def api_session() -> AiohttpSession | None:
+    """Session for the Bot API server at TELEGRAM_API_URL, or None for api.telegram.org."""
+    if not TELEGRAM_API_URL:
+        return None
+    return AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+
+
+def create_bot(token: str, shards: int = 1) -> tuple[Bot, OutgoingScheduler]:
+    """Bot whose outgoing requests go through the scheduler.
+
+    The global Bot API limit is per token, so with several shards each gets its part.
+    """
+    bot = Bot(token=token, session=api_session())
+    scheduler = OutgoingScheduler(global_rate=GLOBAL_RATE / shards)
+    bot.session.middleware(scheduler)
+    return bot, scheduler
+
+
+@asynccontextmanager
+async def bot_services(dp: Dispatcher, primary: bool = True, sharded: bool = False,
+                       metrics_port: int = metrics.METRICS_PORT):
+    """Run what the handlers depend on; `primary` also runs the jobs only one process may run.
+
+    `sharded` means other processes share the database, so cached state is reloaded
+    periodically — in every shard worker, the primary one included.
+    """
+    # Пул графиков прогревается в фоне уже после старта опроса.
+    charts.start()
+    http_session = create_http_session()
+    dp["http_session"] = http_session
+    metrics_runner = await metrics.start_server(metrics_port)
+    tasks = [
+        asyncio.create_task(charts.warm_up()),
+        asyncio.create_task(admin_counters.flush_worker()),
+        asyncio.create_task(metrics.loop_lag_monitor()),
+    ]
+    if primary:
+        tasks.append(asyncio.create_task(question_bank.refill_worker(http_session)))
+        tasks.append(asyncio.create_task(quiz_store.eviction_worker()))
+    if sharded:
+        from services import shards
+        tasks.append(asyncio.create_task(shards.refresh_worker()))
+
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await admin_counters.close()
+        await http_session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        charts.shutdown()
+
+
+async def serve(dp: Dispatcher, bot: Bot, mode: str, **kwargs) -> None:
+    logging.getLogger("bot").info("Запуск занял %.2f с", time.perf_counter() - STARTED)
+    if mode == 'webhook':
+        from services import webhook
+        await webhook.run_webhook(dp, bot, **kwargs)
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot, **kwargs)
+
+
+def run_worker(index: int, count: int, ready) -> None:
+    """Entry point of a shard worker process."""
+    # Останавливает воркеров фронт, закрывая поток обновлений, а не сигнал из терминала.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_worker(index, count, ready))
+
+
+async def _worker(index: int, count: int, ready) -> None:
+    from services import shards
+
+    bot, scheduler = create_bot(getenv('BOT_TOKEN'), count)
+    dp = create_dispatcher()
+    await db.load_caches()
+    try:
+        metrics_port = metrics.METRICS_PORT + index if metrics.METRICS_PORT else 0
+        async with bot_services(dp, primary=index == 0, sharded=True, metrics_port=metrics_port):
+            await shards.serve_shard(dp, bot, index, ready)
+    finally:
+        await scheduler.close()
+        await bot.session.close()
+        await db.close_db()
+
+
+async def run_front(token: str, mode: str, count: int) -> None:
+    """Receive updates and hand each to the shard worker that owns its chat."""
+    from services import shards
+
+    bot = Bot(token=token, session=api_session())
+    await bot.set_my_commands(COMMANDS)
+    await db.create_db()
+    # Воркеры подписываются на те же типы обновлений, что и обычный диспетчер.
+    allowed_updates = create_dispatcher().resolve_used_update_types()
+
+    loop = asyncio.get_running_loop()
+    processes, ports = await loop.run_in_executor(None, shards.start_workers, run_worker, count)
+    router = shards.ShardRouter(ports)
+    front = Dispatcher(disable_fsm=True)
+    front.update.outer_middleware(router)
+    try:
+        await router.connect()
+        if mode == 'webhook':
+            await serve(front, bot, mode, allowed_updates=allowed_updates)
+        else:
+            # Последовательно, чтобы обновления одного чата уходили в порядке получения.
+            await serve(front, bot, mode, allowed_updates=allowed_updates, handle_as_tasks=False)
+    finally:
+        await router.close()
+        await loop.run_in_executor(None, shards.stop_workers, processes)
+        await db.close_db()
+
+
+async def main() -> None:
+    """Main function to start the bot."""
+    token = getenv('BOT_TOKEN')
+    if not token:
+        raise RuntimeError("BOT_TOKEN не установлен. Положите токен в .env или в переменные окружения.")
+    mode = getenv('BOT_MODE', 'polling')
+    if mode not in ('polling', 'webhook'):
+        raise RuntimeError(f"Неизвестный BOT_MODE: {mode}. Допустимо: polling или webhook.")
+    shard_count = int(getenv('BOT_SHARDS', '1'))
+    if shard_count > 1:
+        await run_front(token, mode, shard_count)
+        return
+
+    bot, scheduler = create_bot(token)
+    dp = create_dispatcher()
+    await bot.set_my_commands(COMMANDS)
+    await db.create_db()
+
+    try:
+        async with bot_services(dp):
+            await serve(dp, bot, mode)
+    finally:
+        await scheduler.close()
+        await db.close_db()
@@ -0,0 +1,89 @@
+"""Параллельное завершение викторин одного пользователя: ни одно приращение не теряется.
+
+N вызовов db.complete_quiz для одного chat_id запускаются одновременно на
+временной базе, затем raiting, admin_stats, daily_scores, quiz_attempts и
+индекс рейтинга в памяти сверяются с ожидаемыми суммами. При расхождении
+скрипт завершается с кодом 1.
+
+Запуск: python benchmarks/complete_quiz.py [--quizzes 500]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database.db as db
+from database import ranking
+
+CHAT_ID = 777
+SUBJECTS = ("математика", "физика")
+
+
+async def run(quizzes: int) -> list[str]:
+    rng = random.Random(0)
+    results = [(rng.randint(0, 10), rng.choice(SUBJECTS)) for _ in range(quizzes)]
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(db.complete_quiz(CHAT_ID, score, subject, "Базовый") for score, subject in results))
+    elapsed = time.perf_counter() - started
+    print(f"{quizzes} параллельных complete_quiz за {elapsed:.2f} с")
+
+    total = sum(score for score, _ in results)
+    by_subject = {subject: [0, 0] for subject in SUBJECTS}
+    for score, subject in results:
+        by_subject[subject][0] += score
+        by_subject[subject][1] += 1
+
+    raiting = await db.connect_to_db(
+        "SELECT total_score, attempts, avg_score FROM raiting WHERE chat_id = ?", (CHAT_ID,), fetch=True)
+    admin = await db.connect_to_db(
+        "SELECT quizzes_taken, total_score FROM admin_stats WHERE chat_id = ?", (CHAT_ID,), fetch=True)
+    daily = await db.connect_to_db(
+        "SELECT subject, total, cnt FROM daily_scores WHERE chat_id = ? AND day = ?",
+        (CHAT_ID, datetime.date.today().isoformat()), fetch=True)
+    attempts = await db.connect_to_db(
+        "SELECT COUNT(*), SUM(score) FROM quiz_attempts WHERE chat_id = ?", (CHAT_ID,), fetch=True)
+
+    checks = {
+        "все вызовы успешны": (outcomes.count(True), quizzes),
+        "quiz_attempts": (tuple(attempts[0]), (quizzes, total)),
+        "raiting": (tuple(raiting[0][:2]), (total, quizzes)),
+        "raiting.avg_score": (round(raiting[0][2], 9), round(total / quizzes, 9)),
+        "admin_stats": (tuple(admin[0]), (quizzes, total)),
+        "daily_scores": ({subject: [t, c] for subject, t, c in daily}, by_subject),
+        # Индекс хранит средний балл с точностью до корзины; последняя запись должна быть итоговой.
+        "индекс рейтинга": (ranking.index._buckets.get(CHAT_ID), ranking.index._bucket(total / quizzes)),
+    }
+    failures = []
+    for name, (actual, expected) in checks.items():
+        ok = actual == expected
+        print(f"{'✅' if ok else '❌'} {name}: {actual}" + ("" if ok else f", ожидалось {expected}"))
+        if not ok:
+            failures.append(name)
+    return failures
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quizzes", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.db_path = os.path.join(tmp, "complete_quiz.sqlite3")
+        await db.create_db()
+        try:
+            failures = await run(args.quizzes)
+        finally:
+            await db.close_db()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
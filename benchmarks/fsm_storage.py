@@ -0,0 +1,85 @@
+"""Сравнение SQLiteStorage и MemoryStorage на полном сценарии викторины.
+
+Запуск: python benchmarks/fsm_storage.py [--chats 2000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import database.db as db
+from database.fsm_storage import SQLiteStorage
+import states.states as states
+
+QUIZ = [
+    [f"Вопрос {i}: " + "текст " * 20, {"A": "вариант", "B": "вариант", "C": "вариант", "D": "вариант"}, "B", "объяснение " * 30]
+    for i in range(10)
+]
+
+
+async def quiz_flow(state: FSMContext) -> None:
+    """Те же обращения к FSM, что делают хендлеры от /start до конца викторины."""
+    await state.set_state(states.Reg.name)
+    await state.update_data({'name': 'Иван'})
+    await state.set_state(states.Reg.last_name)
+    await state.update_data({'last_name': 'Иванов'})
+    await state.get_data()
+    await state.clear()
+
+    await state.set_state(states.QuizSettingsState.subject)
+    await state.update_data(subject='математика')
+    await state.set_state(states.QuizSettingsState.level)
+    await state.update_data(level='🔰 Лёгкий')
+    await state.get_data()
+    await state.get_data()
+    await state.update_data(quiz=QUIZ)
+    await state.set_state(states.QuizState.current_question)
+
+    for question in range(10):
+        await state.get_state()
+        data = await state.get_data()
+        await state.update_data(right_answers=data.get('right_answers', 0) + 1, current_question=question)
+        await state.get_state()
+        await state.get_data()
+        await state.update_data(current_question=question)
+
+    await state.get_data()
+    await state.clear()
+
+
+async def run(storage, chats: int) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        quiz_flow(FSMContext(storage, StorageKey(bot_id=1, chat_id=chat_id, user_id=chat_id)))
+        for chat_id in range(chats)
+    ))
+    await storage.close()
+    return time.perf_counter() - started
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.db_path = os.path.join(tmp, "bench.sqlite3")
+        await db.create_db()
+
+        for name, storage in (("MemoryStorage", MemoryStorage()), ("SQLiteStorage", SQLiteStorage())):
+            elapsed = await run(storage, args.chats)
+            print(f"{name:14} {args.chats} викторин за {elapsed:.3f} с ({args.chats / elapsed:,.0f} викторин/с)")
+
+        await db.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,225 @@
+"""Проверка GenerationClient против локальной поддельной модели, без сети.
+
+Поддельный chat-completions сервер отвечает по-разному в зависимости от
+модели в запросе: сразу, с задержкой первого байта или ошибкой 500, и
+запоминает, какие запросы клиент оборвал. Проверяется:
+- хедж: если основная модель молчит дольше hedge_delay, запасная
+  спрашивается параллельно, и llm_hedged_requests растёт;
+- побеждает тот запрос, который первым дал годный элемент, второй отменяется
+  и не считается отказом модели;
+- когда потребитель получил своё и закрыл поток, ответ победителя
+  дочитывается ради расхода токенов не дольше usage_grace, а потом
+  обрывается; отмена потребителя не засчитывается модели как успех;
+- circuit breaker открывается после порога отказов, пропускает одну пробную
+  попытку после cooldown и закрывается, если она удалась;
+- между неудачными попытками выдерживается пауза backoff_delay.
+При любом расхождении скрипт завершается с кодом 1.
+
+Запуск: python benchmarks/llm_client.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from contextlib import aclosing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from aiohttp import web
+
+from loadtest import serve
+from services import llm, metrics
+
+# Модель присылает больше элементов, чем берёт потребитель: так видно, оборван ли ответ.
+STREAMED = 10
+ITEMS = 3
+
+
+class FakeModels:
+    """Streams STREAMED lines per request; `modes[model]` is "ok", "500" or a first-byte delay in seconds."""
+
+    def __init__(self) -> None:
+        self.modes: dict[str, object] = {}
+        self.calls: list[str] = []
+        self.aborted: list[str] = []
+        self.completed: list[str] = []
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/chat", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        model = (await request.json())["model"]
+        self.calls.append(model)
+        mode = self.modes.get(model, "ok")
+        if mode == "500":
+            return web.json_response({"error": {"message": "overloaded"}}, status=500)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            # Пока модель «думает», шлём SSE-комментарии: так обрыв соединения виден сразу.
+            deadline = time.monotonic() + (mode if isinstance(mode, float) else 0)
+            while time.monotonic() < deadline:
+                await response.write(b": thinking\n\n")
+                await asyncio.sleep(0.02)
+            for i in range(STREAMED):
+                chunk = {"choices": [{"delta": {"content": f"{model}-{i}\n"}}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                await asyncio.sleep(0.03)
+            usage = {"prompt_tokens": 7, "completion_tokens": STREAMED}
+            await response.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            self.completed.append(model)
+        except (ConnectionError, asyncio.CancelledError):
+            self.aborted.append(model)
+        return response
+
+
+class LineParser:
+    def __init__(self) -> None:
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        *lines, self._buffer = (self._buffer + text).split("\n")
+        return lines
+
+
+def circuit_open(model: str) -> str | None:
+    """The llm_circuit_open value exported for `model`, as /metrics shows it."""
+    prefix = f'llm_circuit_open{{model="{model}"}} '
+    return next((line[len(prefix):] for line in metrics.render().splitlines() if line.startswith(prefix)), None)
+
+
+async def collect(client: llm.GenerationClient, session: aiohttp.ClientSession, limit: int = ITEMS,
+                  usage: dict | None = None) -> list[str]:
+    items = []
+    # Закрываем поток сразу, как делает потребитель: вердикт победителю выносится в finally.
+    async with aclosing(client.stream(session, {}, lambda: {"messages": []}, LineParser, usage)) as stream:
+        async for item in stream:
+            items.append(item)
+            if len(items) == limit:
+                break
+    return items
+
+
+async def main() -> None:
+    fake = FakeModels()
+    runner, port = await serve(fake.app())
+    url = f"http://127.0.0.1:{port}/chat"
+    failures = []
+
+    def check(name: str, actual, expected) -> None:
+        ok = actual == expected
+        print(f"{'✅' if ok else '❌'} {name}: {actual}" + ("" if ok else f", ожидалось {expected}"))
+        if not ok:
+            failures.append(name)
+
+    delays = []
+    real_backoff = llm.backoff_delay
+
+    def recorded_backoff(attempt: int) -> float:
+        delays.append(attempt)
+        return 0.1
+
+    llm.backoff_delay = recorded_backoff
+
+    async with aiohttp.ClientSession() as session:
+        # Основная модель молчит: через hedge_delay спрашиваем запасную, она и побеждает.
+        client = llm.GenerationClient(url, ["a", "b"], max_attempts=2, hedge_delay=0.1, usage_grace=0.05)
+        fake.modes.update(a=1.0, b="ok")
+        hedged = metrics.llm_hedged_requests.value(model="b")
+        items = await collect(client, session)
+        await asyncio.sleep(0.1)
+        check("хедж: ответила запасная", items, ["b-0", "b-1", "b-2"])
+        check("хедж: запросы", fake.calls, ["a", "b"])
+        check("хедж: llm_hedged_requests{b}", metrics.llm_hedged_requests.value(model="b") - hedged, 1)
+        check("хедж: оборваны проигравший, затем победитель", fake.aborted, ["a", "b"])
+        check("хедж: ответов до конца", fake.completed, [])
+        check("хедж: отмена не считается отказом", client.breakers["a"].failures, 0)
+
+        # Основная успевает первой уже после старта запасной: отменяется запасная.
+        fake.calls.clear(), fake.aborted.clear()
+        fake.modes.update(a=0.2, b=1.0)
+        items = await collect(client, session)
+        await asyncio.sleep(0.1)
+        check("первый годный: ответила основная", items, ["a-0", "a-1", "a-2"])
+        check("первый годный: запросы", fake.calls, ["a", "b"])
+        check("первый годный: оборваны запасная, затем основная", fake.aborted, ["b", "a"])
+
+        # Две ошибки подряд открывают breaker, дальше запросы идут в b.
+        client = llm.GenerationClient(url, ["a", "b"], max_attempts=3, hedge_delay=1.0, usage_grace=0.05)
+        client.breakers = {model: llm.CircuitBreaker(threshold=2, cooldown=0.5) for model in client.models}
+        fake.calls.clear(), fake.aborted.clear(), delays.clear()
+        fake.modes.update(a="500", b="ok")
+        started = time.perf_counter()
+        items = await collect(client, session)
+        elapsed = time.perf_counter() - started
+        check("breaker: запросы", fake.calls, ["a", "a", "b"])
+        check("breaker: ответила b", items, ["b-0", "b-1", "b-2"])
+        check("breaker: a открыт", client.breakers["a"].is_open, True)
+        check("breaker: llm_circuit_open{a}", circuit_open("a"), "1")
+        check("backoff: паузы перед попытками", delays, [0, 1])
+        check("backoff: паузы выдержаны", elapsed >= 0.2, True)
+
+        fake.calls.clear()
+        await collect(client, session)
+        check("breaker: открытая модель пропускается", fake.calls, ["b"])
+
+        # После cooldown пропускается одна пробная попытка; неудачная снова открывает breaker.
+        await asyncio.sleep(0.55)
+        fake.calls.clear()
+        await collect(client, session)
+        check("полуоткрытый: неудачная проба", fake.calls, ["a", "b"])
+        check("полуоткрытый: снова открыт", client.breakers["a"].is_open, True)
+
+        await asyncio.sleep(0.55)
+        fake.calls.clear()
+        fake.modes.update(a="ok")
+        items = await collect(client, session)
+        check("полуоткрытый: удачная проба", fake.calls, ["a"])
+        check("полуоткрытый: ответила a", items, ["a-0", "a-1", "a-2"])
+        check("полуоткрытый: breaker закрыт", client.breakers["a"].is_open, False)
+        check("полуоткрытый: llm_circuit_open{a}", circuit_open("a"), "0")
+
+        # Потребитель взял все элементы: хвост ответа с расходом токенов успевает прийти за usage_grace.
+        client = llm.GenerationClient(url, ["a"], max_attempts=1, hedge_delay=1.0, usage_grace=1.0)
+        await asyncio.sleep(0.1)
+        fake.calls.clear(), fake.aborted.clear(), fake.completed.clear()
+        usage = {}
+        items = await collect(client, session, limit=STREAMED, usage=usage)
+        check("расход: получены все элементы", len(items), STREAMED)
+        check("расход: ответ дочитан", (fake.completed, fake.aborted), (["a"], []))
+        check("расход: токены учтены", usage, {"prompt_tokens": 7, "completion_tokens": STREAMED})
+
+        # Потребителя отменили (пользователь ушёл): ответ обрывается, но успехом модели не считается.
+        client = llm.GenerationClient(url, ["a"], max_attempts=1, hedge_delay=1.0)
+        client.breakers["a"].failures = 1
+        await asyncio.sleep(0.1)
+        fake.calls.clear(), fake.aborted.clear(), fake.completed.clear()
+        first = asyncio.Event()
+
+        async def consume() -> None:
+            async with aclosing(client.stream(session, {}, lambda: {"messages": []}, LineParser)) as stream:
+                async for _ in stream:
+                    first.set()
+
+        consumer = asyncio.create_task(consume())
+        await first.wait()
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        await asyncio.sleep(0.1)
+        check("отмена: ответ оборван", fake.aborted, ["a"])
+        check("отмена: отказы модели не сброшены", client.breakers["a"].failures, 1)
+
+    llm.backoff_delay = real_backoff
+    await runner.cleanup()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,425 @@
+"""Нагрузочный тест всего бота без сети: настоящие роутеры, поддельные Bot API и OpenRouter.
+
+Синтетические пользователи проходят /start → регистрация → викторина → 10 ответов →
+📈 Моя статистика → 🏆 Рейтинг. Бот работает как в проде (app.create_bot,
+create_dispatcher, bot_services, long polling), только TELEGRAM_API_URL и
+OPENROUTER_URL указывают на локальные серверы из этого скрипта. В конце печатаются
+пропускная способность, p50/p95/p99 по хендлерам и шагам пользователя и задержка
+event loop.
+
+Запуск: python benchmarks/loadtest.py [--users 50] [--ramp 5] [--llm-latency 0.5]
+        [--llm-chunk-delay 0.01] [--llm-failure-rate 0.05] [--llm-bad-item-rate 0.05]
+        [--bank-low-water N]
+"""
+import argparse
+import asyncio
+import collections
+import importlib
+import itertools
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from typing import TYPE_CHECKING
+
+from aiohttp import web
+
+if TYPE_CHECKING:
+    from aiogram import Router
+
+BOT_TOKEN = "42:LOADTEST"
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+FIRST_CHAT_ID = 10_000
+STEP_TIMEOUT = 120
+
+
+class Reply:
+    """One thing the bot did in a chat: a sent or edited message."""
+
+    def __init__(self, method: str, message_id: int, text: str, markup: dict | None) -> None:
+        self.method = method
+        self.message_id = message_id
+        self.text = text or ""
+        self.markup = markup or {}
+
+
+class FakeTelegram:
+    """Bot API server answering the methods the bot uses; users talk to it through push_*."""
+
+    def __init__(self) -> None:
+        self.calls: collections.Counter[str] = collections.Counter()
+        self.updates_sent = 0
+        self._updates: list[dict] = []
+        self._new_update = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._inboxes: dict[int, asyncio.Queue] = collections.defaultdict(asyncio.Queue)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=32 * 2**20)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    # --- сторона пользователя ---
+
+    def _push(self, update: dict) -> None:
+        update["update_id"] = next(self._update_ids)
+        self._updates.append(update)
+        self.updates_sent += 1
+        self._new_update.set()
+
+    def push_message(self, chat_id: int, first_name: str, text: str) -> None:
+        user = {"id": chat_id, "is_bot": False, "first_name": first_name}
+        self._push({"message": {
+            "message_id": next(self._message_ids), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": first_name},
+            "from": user, "text": text,
+        }})
+
+    def push_callback(self, chat_id: int, first_name: str, message_id: int, data: str) -> None:
+        user = {"id": chat_id, "is_bot": False, "first_name": first_name}
+        self._push({"callback_query": {
+            "id": str(next(self._update_ids)), "from": user, "chat_instance": str(chat_id), "data": data,
+            "message": {
+                "message_id": message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private", "first_name": first_name},
+                "from": BOT_USER, "text": "",
+            },
+        }})
+
+    async def next_reply(self, chat_id: int) -> Reply:
+        return await self._inboxes[chat_id].get()
+
+    # --- сторона бота ---
+
+    def _message(self, chat_id: int, message_id: int | None = None, **extra) -> dict:
+        return {
+            "message_id": message_id or next(self._message_ids), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER, **extra,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = dict(await request.post())
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        markup = json.loads(params["reply_markup"]) if params.get("reply_markup") else None
+
+        if method == "getUpdates":
+            result = await self._get_updates(int(params.get("offset", 0)), float(params.get("timeout", 0)))
+        elif method == "getMe":
+            result = BOT_USER
+        elif method == "sendMessage":
+            result = self._message(chat_id, text=params.get("text", ""))
+            self._inboxes[chat_id].put_nowait(Reply(method, result["message_id"], params.get("text"), markup))
+        elif method == "sendPhoto":
+            photo = [{"file_id": "photo", "file_unique_id": "photo", "width": 1, "height": 1}]
+            result = self._message(chat_id, photo=photo)
+            self._inboxes[chat_id].put_nowait(Reply(method, result["message_id"], params.get("caption"), markup))
+        elif method == "sendMediaGroup":
+            result = [self._message(chat_id) for _ in json.loads(params["media"])]
+        elif method == "editMessageText":
+            message_id = int(params["message_id"])
+            result = self._message(chat_id, message_id, text=params.get("text", ""))
+            self._inboxes[chat_id].put_nowait(Reply(method, message_id, params.get("text"), markup))
+        else:
+            # sendChatAction, answerCallbackQuery, setMyCommands, deleteWebhook, ...
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, offset: int, timeout: float) -> list[dict]:
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:100]
+
+
+class FakeOpenRouter:
+    """Chat completions endpoint that streams a quiz after `latency` s, failing at `failure_rate`.
+
+    Answers with as many questions as the prompt asks for; `bad_item_rate` of
+    them name an answer that is not among the options.
+    """
+
+    def __init__(self, latency: float, chunk_delay: float, failure_rate: float, bad_item_rate: float,
+                 rng: random.Random) -> None:
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.failure_rate = failure_rate
+        self.bad_item_rate = bad_item_rate
+        self.rng = rng
+        self.requests = 0
+        self.failures = 0
+        self.tokens = 0
+        self._quiz_ids = itertools.count()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/v1/chat/completions", self.handle)
+        return app
+
+    def _quiz(self, count: int) -> str:
+        quiz_id = next(self._quiz_ids)
+        return json.dumps({"items": [
+            {"q": f"Вопрос {quiz_id}-{i}: сколько будет {i} + {quiz_id}?",
+             "o": [str(i + quiz_id), str(i + quiz_id + 1), str(i), str(quiz_id)],
+             "a": "E" if self.rng.random() < self.bad_item_rate else "A", "e": f"{i} + {quiz_id} = {i + quiz_id}"}
+            for i in range(count)
+        ]}, ensure_ascii=False)
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+        await asyncio.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            return web.json_response({"error": {"message": "overloaded"}}, status=self.rng.choice((429, 500, 503)))
+
+        prompt = body["messages"][-1]["content"]
+        count = re.search(r"Сгенерируй (\d+)", prompt)
+        content = self._quiz(int(count.group(1)) if count else 10)
+        # Грубая оценка в духе BPE: около 4 символов на токен.
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        self.tokens += sum(usage.values())
+        if not body.get("stream"):
+            return web.json_response({"choices": [{"message": {"content": content}}], "usage": usage})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        try:
+            await response.prepare(request)
+            for i in range(0, len(content), 40):
+                chunk = {"choices": [{"delta": {"content": content[i:i + 40]}}]}
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                await asyncio.sleep(self.chunk_delay)
+            await response.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionError:
+            # Клиент перестаёт читать, как только получил 10 вопросов.
+            pass
+        return response
+
+
+class HandlerTimer:
+    """Inner middleware that records how long each handler function runs.
+
+    A plain callable rather than a BaseMiddleware: chart workers re-run this
+    script on spawn, and aiogram at module level would cost each of them seconds.
+    """
+
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = collections.defaultdict(list)
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.samples[data["handler"].callback.__name__].append(time.perf_counter() - started)
+
+    def install(self, router: "Router") -> None:
+        # Внутренние middleware роутера действуют и на хендлеры вложенных роутеров.
+        router.message.middleware(self)
+        router.callback_query.middleware(self)
+
+
+class StepTimeout(Exception):
+    pass
+
+
+class SyntheticUser:
+    def __init__(self, tg: FakeTelegram, number: int, rng: random.Random, steps: dict[str, list[float]]) -> None:
+        self.tg = tg
+        self.chat_id = FIRST_CHAT_ID + number
+        self.number = number
+        self.rng = rng
+        self.steps = steps
+        self.updates = 0
+
+    async def _expect(self, step: str, started: float, predicate) -> Reply:
+        deadline = started + STEP_TIMEOUT
+        while True:
+            try:
+                reply = await asyncio.wait_for(self.tg.next_reply(self.chat_id), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                raise StepTimeout(step) from None
+            if predicate(reply):
+                self.steps[step].append(time.perf_counter() - started)
+                return reply
+
+    async def say(self, step: str, text: str, predicate) -> Reply:
+        started = time.perf_counter()
+        self.updates += 1
+        self.tg.push_message(self.chat_id, "Иван", text)
+        return await self._expect(step, started, predicate)
+
+    async def press(self, step: str, message_id: int, data: str, predicate) -> Reply:
+        started = time.perf_counter()
+        self.updates += 1
+        self.tg.push_callback(self.chat_id, "Иван", message_id, data)
+        return await self._expect(step, started, predicate)
+
+    async def run(self) -> bool:
+        """Go through the whole scenario; False if the quiz could not be generated."""
+        sent = lambda text: lambda r: r.method == "sendMessage" and text in r.text
+
+        await self.say("/start", "/start", sent("имя"))
+        await self.say("имя", "Иван", sent("фамилию"))
+        await self.say("фамилия", f"Тестов{self.number}", sent("Готов начать"))
+
+        reply = await self.say("начать викторину", "📚 Начать викторину", sent("Выберите предмет"))
+        subject = self.rng.choice(reply.markup["keyboard"])[0]["text"]
+        reply = await self.say("предмет", subject, sent("Выберите уровень"))
+        level = self.rng.choice(reply.markup["inline_keyboard"][0])["callback_data"]
+
+        reply = await self.press(
+            "уровень → вопрос 1", reply.message_id, level,
+            lambda r: r.method == "sendMessage" and (r.text.startswith("Вопрос №1.") or "Не удалось" in r.text or r.text == "Ошибка.")
+        )
+        generated = reply.text.startswith("Вопрос №1.")
+        if generated:
+            for index in range(10):
+                option = self.rng.choice(reply.markup["inline_keyboard"])[0]["callback_data"]
+                if index < 9:
+                    prompt = await self.press("ответ", reply.message_id, option, sent("Следующий вопрос"))
+                    reply = await self.press("следующий вопрос", prompt.message_id, "next_qst", sent(f"Вопрос №{index + 2}."))
+                else:
+                    await self.press("последний ответ", reply.message_id, option, sent("Викторина завершена"))
+
+        await self.say(
+            "моя статистика", "📈 Моя статистика",
+            lambda r: r.method == "sendPhoto" or (r.method == "sendMessage" and "статистик" in r.text)
+        )
+        await self.say("рейтинг", "🏆 Рейтинг", sent("Рейтинг"))
+        return generated
+
+
+async def monitor_loop_lag(samples: list[float], interval: float = 0.02) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - started - interval)
+
+
+def percentiles(samples: list[float]) -> tuple[float, float, float]:
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+def print_table(title: str, samples: dict[str, list[float]]) -> None:
+    print(f"\n{title:28} {'n':>6} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+    for name, values in samples.items():
+        p50, p95, p99 = percentiles(values)
+        print(f"{name:28} {len(values):6} {p50 * 1000:9.1f} {p95 * 1000:9.1f} {p99 * 1000:9.1f}")
+
+
+async def serve(app: web.Application) -> tuple[web.AppRunner, int]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--ramp", type=float, default=5, help="за сколько секунд подключаются все пользователи")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="задержка до первого байта ответа модели, с")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.01, help="пауза между чанками потока, с")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.05)
+    parser.add_argument("--llm-bad-item-rate", type=float, default=0.05,
+                        help="доля вопросов с ответом не из вариантов")
+    parser.add_argument("--bank-low-water", type=int, help="QUESTION_BANK_LOW_WATER; 0 — каждая викторина генерируется")
+    parser.add_argument("--chat-rate", type=float,
+                        help="OUTGOING_CHAT_RATE; по умолчанию лимит Telegram, 1 сообщение в секунду в чат")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tg = FakeTelegram()
+    llm = FakeOpenRouter(args.llm_latency, args.llm_chunk_delay, args.llm_failure_rate, args.llm_bad_item_rate, rng)
+    tg_runner, tg_port = await serve(tg.app())
+    llm_runner, llm_port = await serve(llm.app())
+
+    # Модули бота читают настройки при импорте, поэтому импортируем их только теперь.
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{tg_port}"
+    os.environ["OPENROUTER_URL"] = f"http://127.0.0.1:{llm_port}/api/v1/chat/completions"
+    os.environ["OPENROUTER_API_KEY"] = "loadtest"
+    if args.chat_rate is not None:
+        os.environ["OUTGOING_CHAT_RATE"] = str(args.chat_rate)
+    if args.bank_low_water is not None:
+        os.environ["QUESTION_BANK_LOW_WATER"] = str(args.bank_low_water)
+    app = importlib.import_module("app")
+    db = importlib.import_module("database.db")
+    question_bank = importlib.import_module("services.question_bank")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.db_path = os.path.join(tmp, "loadtest.sqlite3")
+        bot, scheduler = app.create_bot(BOT_TOKEN)
+        dp = app.create_dispatcher()
+        timer = HandlerTimer()
+        timer.install(dp)
+        await db.create_db()
+
+        print("Запуск пула графиков и бота...")
+        async with app.bot_services(dp):
+            polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+            lag: list[float] = []
+            lag_task = asyncio.create_task(monitor_loop_lag(lag))
+            steps: dict[str, list[float]] = collections.defaultdict(list)
+            users = [SyntheticUser(tg, number, random.Random(args.seed * 100_003 + number), steps) for number in range(args.users)]
+
+            async def run_user(user: SyntheticUser) -> bool | None:
+                await asyncio.sleep(args.ramp * user.number / max(args.users, 1))
+                try:
+                    return await user.run()
+                except StepTimeout as e:
+                    print(f"пользователь {user.chat_id}: не дождался ответа на шаге «{e}»")
+                    return None
+
+            print(f"{args.users} пользователей...")
+            started = time.perf_counter()
+            results = await asyncio.gather(*(run_user(user) for user in users))
+            elapsed = time.perf_counter() - started
+
+            lag_task.cancel()
+            await dp.stop_polling()
+            await polling
+
+        await scheduler.close()
+        await bot.session.close()
+        await db.close_db()
+    await tg_runner.cleanup()
+    await llm_runner.cleanup()
+
+    updates = sum(user.updates for user in users)
+    api_calls = sum(count for method, count in tg.calls.items() if method != "getUpdates")
+    print(f"\nПользователей: {args.users}: прошли сценарий {results.count(True)}, "
+          f"без викторины {results.count(False)}, зависли {results.count(None)}; {elapsed:.1f} с")
+    print(f"Обновлений: {updates} ({updates / elapsed:.1f}/с), вызовов Bot API: {api_calls} ({api_calls / elapsed:.1f}/с)")
+    print(f"OpenRouter: запросов {llm.requests}, отказов {llm.failures}, токенов {llm.tokens}; "
+          f"банк вопросов: попаданий {question_bank.hits}, промахов {question_bank.misses}")
+    print_table("Хендлер", timer.samples)
+    print_table("Шаг пользователя", steps)
+    p50, _, p99 = percentiles(lag)
+    print(f"\nЗадержка event loop: p50 {p50 * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс, "
+          f"макс. {max(lag, default=0) * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
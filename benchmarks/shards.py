@@ -0,0 +1,113 @@
+"""Пропускная способность шардированного режима в зависимости от числа воркеров.
+
+Фронт раздаёт синтетические обновления воркерам через services.shards, как в
+BOT_SHARDS > 1; хендлер воркера занят чистой работой CPU (разбор JSON викторины),
+к Telegram никто не обращается. Заодно проверяется, что обновления одного чата
+обработаны в порядке отправки.
+
+Запуск: python benchmarks/shards.py [--workers 1 2 4] [--updates 4000] [--chats 200] [--work 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import Message, Update
+
+from services import shards
+
+QUIZ = json.dumps([
+    [f"Вопрос {i}: " + "текст " * 20, {"A": "вариант", "B": "вариант", "C": "вариант", "D": "вариант"}, "B", "объяснение " * 30]
+    for i in range(10)
+], ensure_ascii=False)
+
+
+def bench_worker(index: int, count: int, ready) -> None:
+    asyncio.run(_bench_worker(index, count, ready))
+
+
+async def _bench_worker(index: int, count: int, ready) -> None:
+    work = int(os.environ["SHARD_BENCH_WORK"])
+    last_seen: dict[int, int] = {}
+    out_of_order = 0
+
+    router = Router()
+
+    @router.message(F.text)
+    async def handle(message: Message) -> None:
+        nonlocal out_of_order
+        for _ in range(work):
+            json.loads(QUIZ)
+        seq = int(message.text)
+        if seq < last_seen.get(message.chat.id, -1):
+            out_of_order += 1
+        last_seen[message.chat.id] = seq
+        await asyncio.sleep(0)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot("42:BENCHMARK")
+    await shards.serve_shard(dp, bot, index, ready)
+    await bot.session.close()
+    if out_of_order:
+        print(f"воркер {index}: {out_of_order} обновлений не по порядку")
+
+
+def make_update(update_id: int, chat_id: int, seq: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "u"},
+            "text": str(seq),
+        },
+    })
+
+
+async def run(workers: int, updates: list[Update]) -> float:
+    loop = asyncio.get_running_loop()
+    processes, ports = await loop.run_in_executor(None, shards.start_workers, bench_worker, workers)
+    router = shards.ShardRouter(ports)
+    await router.connect()
+    front = Dispatcher(disable_fsm=True)
+    front.update.outer_middleware(router)
+    bot = Bot("42:BENCHMARK")
+
+    started = time.perf_counter()
+    for update in updates:
+        await front.feed_update(bot, update)
+    await router.close()
+    await loop.run_in_executor(None, shards.stop_workers, processes)
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    return elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=4000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--work", type=int, default=20, help="разборов JSON викторины на обновление")
+    args = parser.parse_args()
+    os.environ["SHARD_BENCH_WORK"] = str(args.work)
+
+    updates = [make_update(i, 1000 + i % args.chats, i) for i in range(args.updates)]
+    print(f"CPU: {os.cpu_count()}")
+    baseline = None
+    for workers in args.workers:
+        elapsed = await run(workers, updates)
+        rate = args.updates / elapsed
+        baseline = baseline or rate
+        print(f"{workers} воркер(ов): {elapsed:6.2f} с, {rate:8,.0f} обновлений/с, x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
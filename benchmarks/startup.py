@@ -0,0 +1,81 @@
+"""Бюджет холодного старта: время от запуска `python bot.py` до ответа на первое обновление.
+
+Бот запускается отдельным процессом против поддельного Bot API из loadtest.py
+с пустой временной базой; в очереди его уже ждёт /start. Замер повторяется
+--runs раз, и если медиана больше --budget секунд, скрипт завершается с кодом 1 —
+так его можно держать в CI как регрессионную проверку.
+
+Запуск: python benchmarks/startup.py [--budget 10] [--runs 3]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+
+from loadtest import BOT_TOKEN, FIRST_CHAT_ID, FakeTelegram, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def measure_once(timeout: float) -> float:
+    """Seconds from spawning the bot process until it answered /start."""
+    tg = FakeTelegram()
+    runner, port = await serve(tg.app())
+    tg.push_message(FIRST_CHAT_ID, "Старт", "/start")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "BOT_TOKEN": BOT_TOKEN,
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{port}",
+            "DB_PATH": os.path.join(tmp, "startup.sqlite3"),
+            "METRICS_PORT": "0",
+            # Банк вопросов не пополняется: модель в этом замере не нужна.
+            "QUESTION_BANK_LOW_WATER": "0",
+            "OPENROUTER_API_KEY": "startup",
+        }
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "bot.py"), cwd=ROOT, env=env,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            await asyncio.wait_for(tg.next_reply(FIRST_CHAT_ID), timeout)
+            first_reply = time.perf_counter() - started
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), 30)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+            await runner.cleanup()
+    return first_reply
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=10, help="допустимая медиана до первого ответа, с")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    samples = []
+    for run in range(args.runs):
+        first_reply = await measure_once(timeout=args.budget * 4)
+        samples.append(first_reply)
+        print(f"запуск {run + 1}: первый ответ через {first_reply:.2f} с")
+
+    median = statistics.median(samples)
+    print(f"\nМедиана: {median:.2f} с, бюджет {args.budget:.2f} с")
+    if median > args.budget:
+        print("❌ Холодный старт вышел за бюджет. Посмотри python bot.py --profile-startup")
+        sys.exit(1)
+    print("✅ В бюджете")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""Память и скорость реестра зарегистрированных chat_id: set против отсортированного array('q').
+
+Запуск: python benchmarks/user_registry.py [--users 100000 1000000]
+"""
+import argparse
+import array
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.registry import UserRegistry
+
+LOOKUPS = 200_000
+
+
+def build_set(ids: list[int]) -> set[int]:
+    return set(ids)
+
+
+def build_registry(ids: list[int]) -> UserRegistry:
+    registry = UserRegistry()
+    registry.replace(array.array('q', sorted(ids)))
+    return registry
+
+
+def measure(build, ids: list[int]) -> tuple[object, int]:
+    tracemalloc.start()
+    container = build(ids)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return container, size
+
+
+def lookup_time(container, probes: list[int]) -> float:
+    started = time.perf_counter()
+    for chat_id in probes:
+        chat_id in container
+    return (time.perf_counter() - started) / len(probes)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for users in args.users:
+        # chat_id в Telegram — до 52 бит; большие числа не попадают в кэш малых int.
+        ids = rng.sample(range(10**9, 10**12), users)
+        probes = [rng.choice(ids) if i % 2 else rng.randrange(10**9, 10**12) for i in range(LOOKUPS)]
+        for name, build in (("set", build_set), ("array('q')", build_registry)):
+            # Память считаем без самих int из списка ids: set хранит ссылки на
+            # уже существующие объекты, поэтому добавляем их размер отдельно.
+            container, size = measure(build, ids)
+            if isinstance(container, set):
+                size += sum(sys.getsizeof(chat_id) for chat_id in ids)
+            print(
+                f"{users:>9,} пользователей  {name:11} {size / 2**20:8.1f} МиБ "
+                f"({size / users:5.1f} Б/польз.)  поиск {lookup_time(container, probes) * 1e9:6.0f} нс"
+            )
+
+
+if __name__ == "__main__":
+    main()
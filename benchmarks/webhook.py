@@ -0,0 +1,173 @@
+"""Проверка вебхука на записанных обновлениях Telegram, без сети.
+
+Поднимает services.webhook.create_app на локальном порту с диспетчером, чьи
+хендлеры только записывают полученное, и шлёт ему POST-запросы с
+настоящими JSON обновлений: сообщение и нажатие inline-кнопки. Проверяется:
+- секрет: верный — 200; неверный, отсутствующий или с не-ASCII символами — 401;
+- битый JSON и не-обновление — 400;
+- обновления доходят до хендлеров;
+- не больше max_concurrency обновлений обрабатываются одновременно;
+- drain дожидается начатых обновлений, после него — 503.
+При любом расхождении скрипт завершается с кодом 1.
+
+Запуск: python benchmarks/webhook.py
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, Message
+from aiohttp import web
+
+from services import webhook
+
+SECRET = "s3cret-token"
+PATH = "/webhook"
+MAX_CONCURRENCY = 3
+
+MESSAGE_UPDATE = {
+    "update_id": 100001,
+    "message": {
+        "message_id": 17, "date": 1760000000, "text": "/start",
+        "chat": {"id": 5001, "type": "private", "first_name": "Ира"},
+        "from": {"id": 5001, "is_bot": False, "first_name": "Ира", "language_code": "ru"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+CALLBACK_UPDATE = {
+    "update_id": 100002,
+    "callback_query": {
+        "id": "4382bfdwdsb323b2d9", "chat_instance": "-7312", "data": "level_1",
+        "from": {"id": 5001, "is_bot": False, "first_name": "Ира"},
+        "message": {
+            "message_id": 18, "date": 1760000001, "text": "Выберите уровень сложности:",
+            "chat": {"id": 5001, "type": "private", "first_name": "Ира"},
+            "from": {"id": 42, "is_bot": True, "first_name": "SmartOGE"},
+        },
+    },
+}
+
+
+def slow_message(update_id: int, text: str = "slow") -> dict:
+    update = json.loads(json.dumps(MESSAGE_UPDATE))
+    update["update_id"] = update_id
+    update["message"]["text"] = text
+    update["message"].pop("entities")
+    return update
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.handled: list[int] = []
+        self.running = 0
+        self.max_running = 0
+        self.release = asyncio.Event()
+
+    def router(self) -> Router:
+        router = Router()
+
+        @router.message(F.text == "slow")
+        async def on_slow(message: Message) -> None:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await self.release.wait()
+            finally:
+                self.running -= 1
+            self.handled.append(message.message_id)
+
+        @router.message()
+        async def on_message(message: Message) -> None:
+            self.handled.append(message.message_id)
+
+        @router.callback_query()
+        async def on_callback(callback: CallbackQuery) -> None:
+            self.handled.append(callback.id)
+
+        return router
+
+
+async def post_raw(port: int, body: bytes, secret: bytes) -> int:
+    """POST with a header aiohttp's client would not send as is; returns the status code."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        b"POST " + PATH.encode() + b" HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+        + webhook.SECRET_HEADER.encode() + b": " + secret + b"\r\n"
+        + b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+    )
+    status_line = await reader.readline()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def main() -> None:
+    recorder = Recorder()
+    dp = Dispatcher()
+    dp.include_router(recorder.router())
+    bot = Bot(token="42:WEBHOOK")
+    app = webhook.create_app(dp, bot, secret=SECRET, path=PATH, max_concurrency=MAX_CONCURRENCY)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    url = f"http://127.0.0.1:{port}{PATH}"
+    handler = app[webhook.handler_key]
+
+    failures = []
+
+    def check(name: str, actual, expected) -> None:
+        ok = actual == expected
+        print(f"{'✅' if ok else '❌'} {name}: {actual}" + ("" if ok else f", ожидалось {expected}"))
+        if not ok:
+            failures.append(name)
+
+    async with aiohttp.ClientSession() as session:
+        async def post(payload, secret: str | None = SECRET, raw: bytes | None = None) -> int:
+            headers = {webhook.SECRET_HEADER: secret} if secret is not None else {}
+            data = raw if raw is not None else json.dumps(payload, ensure_ascii=False).encode()
+            async with session.post(url, data=data, headers={**headers, "Content-Type": "application/json"}) as r:
+                return r.status
+
+        check("сообщение с верным секретом", await post(MESSAGE_UPDATE), 200)
+        check("нажатие кнопки с верным секретом", await post(CALLBACK_UPDATE), 200)
+        check("неверный секрет", await post(MESSAGE_UPDATE, secret="wrong"), 401)
+        check("без секрета", await post(MESSAGE_UPDATE, secret=None), 401)
+        check("секрет не в ASCII", await post_raw(port, json.dumps(MESSAGE_UPDATE).encode(), "сéкрет".encode()), 401)
+        check("битый JSON", await post(None, raw=b"{not json"), 400)
+        check("JSON не обновление", await post({"update_id": "x", "message": 1}), 400)
+        await asyncio.sleep(0.1)
+        check("обновления дошли до хендлеров", sorted(map(str, recorder.handled)), ["17", CALLBACK_UPDATE["callback_query"]["id"]])
+
+        # Ограничение параллельности: лишний запрос ждёт свободного слота до ответа.
+        recorder.handled.clear()
+        slow = [asyncio.create_task(post(slow_message(200000 + i))) for i in range(MAX_CONCURRENCY + 2)]
+        await asyncio.sleep(0.3)
+        check("одновременно обрабатывается", recorder.running, MAX_CONCURRENCY)
+        check("ответов до освобождения слотов", sum(task.done() for task in slow), MAX_CONCURRENCY)
+
+        # drain ждёт начатые обновления; новые после него получают 503.
+        drain = asyncio.create_task(handler.drain(timeout=5))
+        await asyncio.sleep(0.1)
+        check("после drain", await post(MESSAGE_UPDATE), 503)
+        check("drain ждёт начатые", drain.done(), False)
+        recorder.release.set()
+        await drain
+        statuses = await asyncio.gather(*slow)
+        check("статусы ожидавших слот", sorted(statuses), [200] * MAX_CONCURRENCY + [503] * 2)
+        check("начатые обновления завершены", len(recorder.handled), MAX_CONCURRENCY)
+        check("максимум одновременно", recorder.max_running, MAX_CONCURRENCY)
+
+    await runner.cleanup()
+    await bot.session.close()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
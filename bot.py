@@ -1,76 +1,55 @@
-import logging
-from aiogram.types import Update
+"""Entry point: python bot.py [--profile-startup].
+
+Only the standard library is imported here; the bot lives in app.py. Processes
+started by multiprocessing with the spawn method re-run this script as
+__mp_main__, and chart workers must not pay for aiogram and the routers.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+
+def profile_startup(top: int = 25) -> int:
+    """Print the slowest imports of `import app` in a fresh interpreter (python -X importtime).
+
+    Returns the exit code for the command line: non-zero if the import failed.
+    """
+    # Модуль app ищется рядом с этим файлом, откуда бы ни запустили профилирование.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        print(f"Не удалось импортировать app (код {result.returncode}):", file=sys.stderr)
+        print("\n".join(errors[-10:]), file=sys.stderr)
+        return result.returncode
+
+    imports = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative_us), int(self_us), name.strip()))
+
+    total = sum(self_us for _, self_us, _ in imports)
+    print(f"Импорт app: {total / 1e6:.2f} с, модулей: {len(imports)}\n")
+    print(f"{'всего, мс':>10} {'сам, мс':>9}  модуль")
+    for cumulative_us, self_us, name in sorted(imports, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:10.1f} {self_us / 1000:9.1f}  {name}")
+    return 0
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(filename)s:%(lineno)d in %(funcName)s(): %(message)s"
-)
-
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-import asyncio
-from aiogram.types import BotCommand
-
-from dotenv import load_dotenv
-from os import getenv
-
-from bot_handlers.start import start_router
-from bot_handlers.quiz import quiz_router
-from bot_handlers.stats import stats_router
-from bot_handlers.raiting import raiting_router
-from bot_handlers.admin.start import admin_router
-from bot_handlers.admin.stats import admin_stats_router
-from bot_handlers.admin.settings import admin_settings_router
-import database.db as db
-
-
-load_dotenv()
-
-
-async def on_error(update: Update, exception: Exception):
-    logger = logging.getLogger("bot")
-    logger.exception("Unhandled exception: %s", exception)
-    # Попытка ответить пользователю информативно
-    try:
-        if hasattr(update, "message") and update.message:
-            await update.message.reply("Произошла ошибка. Попробуйте ещё раз позже.")
-        elif hasattr(update, "callback_query") and update.callback_query:
-            await update.callback_query.message.reply("Произошла ошибка. Попробуйте ещё раз позже.")
-    except Exception:
-        logger.exception("Failed to send error message to user.")
-    return True
-
-
-async def main() -> None:
-    """Main function to start the bot."""
-    token = getenv('BOT_TOKEN')
-    if not token:
-        raise RuntimeError("BOT_TOKEN не установлен. Положите токен в .env или в переменные окружения.")
-    bot = Bot(token=token)
-    dp = Dispatcher(storage=MemoryStorage())
-    dp.include_router(admin_router)
-    dp.include_router(admin_stats_router)
-    dp.include_router(admin_settings_router)
-    dp.include_router(quiz_router)
-    dp.include_router(start_router)
-    dp.include_router(stats_router)
-    dp.include_router(raiting_router)
-
-    # dp.errors.register(on_error)
-
-    commands = [
-        BotCommand(command="start", description="Запуск бота"),
-        BotCommand(command="quiz", description="Начать викторину"),
-        BotCommand(command="stats", description="Моя статистика"),
-        BotCommand(command="help", description="Помощь"),
-    ]
-
-    await bot.set_my_commands(commands)
-
-    db.create_db()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SmartOGE Telegram bot")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="показать, какие импорты замедляют запуск, и выйти")
+    if parser.parse_args().profile_startup:
+        sys.exit(profile_startup())
 
-    await dp.start_polling(bot)
+    import asyncio
 
-if __name__ == "__main__":
-    asyncio.run(main())
+    import app
+    asyncio.run(app.main())
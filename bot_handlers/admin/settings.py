@@ -3,6 +3,7 @@ from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, R
 from aiogram.fsm.context import FSMContext
 
 from database import db
+from database.subjects import catalog
 from keyboards.reply import settings_markup, admin_buttons
 import states.states as states
 
@@ -35,12 +36,12 @@ async def back_to_admin_menu(message: Message) -> None:
 @admin_settings_router.message(F.text == '1. Управление пользователями')
 async def handle_settings_1(message: Message) -> None:
     """Handle user management settings."""
-    users = db.get_all_users()
+    users = await db.get_all_users()
 
     await message.answer(f"Список всех пользователей:")
 
     for user in users:
-        user_id, name, lastname, chat_id, statistics = user
+        user_id, name, lastname, chat_id = user
 
         markup = InlineKeyboardMarkup(
             inline_keyboard=[
@@ -55,7 +56,7 @@ async def handle_settings_1(message: Message) -> None:
 async def delete_user_callback(callback_query, state: FSMContext) -> None:
     """Handle user deletion."""
     user_id = int(callback_query.data.split('_')[-1])
-    db.delete_user(user_id)
+    await db.delete_user(user_id)
     await callback_query.message.answer(f"Пользователь с ID {user_id} был удален.", reply_markup=admin_buttons)
     await callback_query.answer()
 
@@ -79,8 +80,7 @@ async def handle_settings_2(message: Message) -> None:
 @admin_settings_router.message(F.text == '1. Добавить/Удалить предметы')
 async def manage_quiz_subjects(message: Message) -> None:
     """Manage quiz subjects."""
-    subjects = db.get_subjects()
-    subject_list = "\n".join([f"- {subject[0].upper()}" for subject in subjects])
+    subject_list = "\n".join([f"- {subject.upper()}" for subject in catalog])
     markup = ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text='Добавить предмет')],
@@ -105,10 +105,10 @@ async def add_quiz_subject_prompt(message: Message, state: FSMContext) -> None:
 async def process_add_quiz_subject(message: Message, state: FSMContext) -> None:
     """Process adding a new quiz subject."""
     new_subject = message.text.strip()
-    if new_subject in db.get_subjects():
+    if new_subject in catalog:
         await message.answer("Этот предмет уже существует.")
     else:
-        db.add_subject(new_subject)
+        await db.add_subject(new_subject)
         await message.answer(f"Предмет '{new_subject}' успешно добавлен.")
     await state.clear()
 
@@ -125,12 +125,11 @@ async def delete_quiz_subject_prompt(message: Message, state: FSMContext) -> Non
 @admin_settings_router.message(states.DeleteSubjectState.subject)
 async def process_delete_quiz_subject(message: Message, state: FSMContext) -> None:
     """Process deleting a quiz subject."""
-    subjects = [subject[0] for subject in db.get_subjects()]
     subject_to_delete = message.text.strip()
-    if subject_to_delete not in subjects:
+    if subject_to_delete not in catalog:
         await message.answer("Этот предмет не найден.")
     else:
-        db.delete_subject(subject_to_delete)
+        await db.delete_subject(subject_to_delete)
         await message.answer(f"Предмет '{subject_to_delete}' успешно удален.")
         await state.clear()
 
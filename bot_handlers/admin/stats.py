@@ -1,74 +1,99 @@
 from aiogram import Router, F
 from aiogram import types
 from aiogram.filters import Command
-import pandas as pd
-from matplotlib import dates
-import matplotlib.pyplot as plt
-
-import json
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.utils.media_group import MediaGroupBuilder
+import asyncio
+import itertools
 import os
 import logging
 
 from bot_handlers.admin.start import IsAdmin
 from middlewares.middlewares import IsAdminMiddleware
 import database.db as db
-from bot_handlers.stats import preprocess_stats
+from database import admin_counters
+from bot_handlers.stats import preprocess_stats, stats_since
+from services import charts, question_bank
 
 admin_stats_router = Router()
 admin_stats_router.message.middleware(IsAdminMiddleware())
 
+# Telegram принимает в одном альбоме не больше 10 фотографий.
+PAGE_SIZE = min(int(os.getenv("ADMIN_STATS_PAGE_SIZE", "5")), 10)
+
 
 @admin_stats_router.message(Command("stats"), IsAdmin())
 @admin_stats_router.message(F.text == '📊 Статистика пользователей')
 async def admin_stats(message: types.Message) -> None:
     """Handle the /stats command for admin users."""
-    users = db.get_all_users()
-    if users is None:
-        await message.answer("Ошибка при получении данных из базы.")
-        return
-
-    for user in users:
-        user_id, name, lastname, chat_id, stats_json = user
-        logging.info(user)
-        try:
-            stats = json.loads(stats_json) if stats_json else {}
-        except Exception as e:
-            await message.answer("Ошибка при обработке статистики ⚠️")
-            logging.error(e)
-            return
-
-        stats_table = preprocess_stats(stats)
-
-        if stats_table.empty:
-            await message.answer("Статистика пуста 📭")
-            return
+    await message.answer(await question_bank.describe(), parse_mode="HTML")
 
-        fig, ax = plt.subplots(figsize=(10, 5))
+    own = await admin_counters.get_stats(message.from_user.id)
+    if own:
+        await message.answer(
+            f"Ваши действия: команд {own['commands_used']}, "
+            f"викторин {own['quizzes_taken']}, баллов {own['total_score']}"
+        )
+    await send_stats_page(message, after_id=0)
 
-        for subject, df_subj in stats_table.groupby("subject"):
-            ax.plot(df_subj["date"], df_subj["value"], marker='o', label=subject)
 
-        ax.set_xlim(stats_table["date"].min() - pd.Timedelta(days=1),
-                    stats_table["date"].max() + pd.Timedelta(days=10))
-
-        ax.set_title('Статистика по дням')
-        ax.set_xlabel('Дата')
-        ax.set_ylabel('Результат')
-        ax.set_ylim(0, 10)
-        ax.grid(True, linestyle="--", alpha=0.7)
-        ax.legend()
-        ax.xaxis.set_major_locator(dates.DayLocator())
-        fig.tight_layout()
-
-        image_path = os.path.join(os.path.dirname(
-            __file__), f"stats_{message.chat.id}.png")
-        fig.savefig(image_path)
-        plt.close(fig)
-
-        await message.answer_photo(types.FSInputFile(image_path), caption=f"Статистика пользователя {name} {lastname} (ID: {chat_id}) 📊")
-            
-        if os.path.exists(image_path):
-            os.remove(image_path)
+@admin_stats_router.callback_query(F.data.startswith('admin_stats_page:'), IsAdmin())
+async def admin_stats_next_page(callback: types.CallbackQuery) -> None:
+    """Send the next page of the users statistics report."""
+    after_id = int(callback.data.split(':')[1])
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await send_stats_page(callback.message, after_id)
 
 
+async def send_stats_page(message: types.Message, after_id: int) -> None:
+    """Render the charts of one page of users in parallel and send them as an album."""
+    users = await db.get_users_page(after_id, PAGE_SIZE)
+    if users is None:
+        await message.answer("Ошибка при получении данных из базы.")
+        return
+    if not users:
+        await message.answer("Больше пользователей нет.")
+        return
 
+    rows = await db.get_stats_for_users([user[3] for user in users], stats_since())
+    if rows is None:
+        await message.answer("Ошибка при обработке статистики ⚠️")
+        return
+    stats_by_chat = {
+        chat_id: [row[1:] for row in chat_rows]
+        for chat_id, chat_rows in itertools.groupby(rows, key=lambda row: row[0])
+    }
+
+    with_stats = [user for user in users if user[3] in stats_by_chat]
+    results = await asyncio.gather(
+        *(charts.render_stats(preprocess_stats(stats_by_chat[user[3]])) for user in with_stats),
+        return_exceptions=True
+    )
+
+    album = MediaGroupBuilder()
+    skipped = [user for user in users if user[3] not in stats_by_chat]
+    for (user_id, name, lastname, chat_id), chart in zip(with_stats, results):
+        if isinstance(chart, Exception):
+            logging.error(f"Failed to render chart for {chat_id}: {chart}")
+            skipped.append((user_id, name, lastname, chat_id))
+            continue
+        album.add_photo(
+            media=types.BufferedInputFile(chart.getvalue(), filename=f"stats_{chat_id}.png"),
+            caption=f"Статистика пользователя {name} {lastname} (ID: {chat_id}) 📊"
+        )
+
+    media = album.build()
+    if media:
+        await message.answer_media_group(media)
+    if skipped:
+        names = "\n".join(f"- {name} {lastname} (ID: {chat_id})" for _, name, lastname, chat_id in skipped)
+        await message.answer(f"Без графика (статистика пуста или не построилась) 📭\n{names}")
+
+    if len(users) == PAGE_SIZE:
+        markup = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(text='➡️ Следующая страница', callback_data=f'admin_stats_page:{users[-1][0]}')]
+            ]
+        )
+        await message.answer("Показать следующих пользователей?", reply_markup=markup)
@@ -5,12 +5,16 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command
 import asyncio
+from aiohttp import ClientSession
 
-from services.utils import generate_quiz, answer_isright
+from services.utils import QUIZ_SIZE, answer_isright
 from bot_handlers.start import show_start_buttons
 import database.db as db
+from database import quiz_store
+from database.subjects import catalog
 from services.utils import show_loading_animation
-from keyboards.inline import levels_inline_markup, continue_markup, return_to_main_markup
+from services import question_bank, quiz_stream
+from keyboards.inline import LEVELS, levels_inline_markup, continue_markup, return_to_main_markup
 from keyboards.reply import get_subjects_markup
 from middlewares.middlewares import AdminStatsMiddleware
 import states.states as states
@@ -22,6 +26,8 @@ import states.states as states
 
 quiz_router = Router()
 
+background_tasks = set()
+
 quiz_router.message.middleware(AdminStatsMiddleware())
 
 
@@ -37,6 +43,10 @@ async def first_step(message: Message, state: FSMContext) -> None:
 @quiz_router.message(states.QuizSettingsState.subject)
 async def choose_subject(message: Message, state: FSMContext) -> None:
     """Handle the subject choice and ask for difficulty level."""
+    if not message.text or message.text not in catalog:
+        await message.answer('Пожалуйста, выберите предмет из списка.', reply_markup=get_subjects_markup())
+        return
+
     await message.answer("✅ Предмет выбран!", reply_markup=ReplyKeyboardRemove())
     await state.update_data(subject=message.text.strip().lower())
     await state.set_state(states.QuizSettingsState.level)
@@ -44,16 +54,10 @@ async def choose_subject(message: Message, state: FSMContext) -> None:
 
 
 @quiz_router.callback_query(F.data.startswith('level_'))
-async def choose_level_and_start_quiz(callback: CallbackQuery, state: FSMContext) -> None:
+async def choose_level_and_start_quiz(callback: CallbackQuery, state: FSMContext, http_session: ClientSession) -> None:
     """Handle the level choice and start the quiz."""
-    level_map = {
-        'level_easy': '🔰 Лёгкий',
-        'level_medium': '⚖️ Средний',
-        'level_hard': '🔥 Сложный'
-    }
-
     level_key = callback.data
-    level_text = level_map.get(level_key)
+    level_text = LEVELS.get(level_key)
 
     if not level_text:
         await callback.answer("Некорректный выбор.")
@@ -72,47 +76,108 @@ async def choose_level_and_start_quiz(callback: CallbackQuery, state: FSMContext
     )
 
     await callback.answer('Мы начинаем!')
-    await start_quiz(callback, state)
+    await start_quiz(callback, state, http_session)
 
 
-async def start_quiz(callback: CallbackQuery, state: FSMContext) -> None:
+async def start_quiz(callback: CallbackQuery, state: FSMContext, http_session: ClientSession) -> None:
     """Generate the quiz and send the first question."""
+    chat_id = callback.message.chat.id
+    # Брошенная на середине викторина не должна перейти в новую: ни её вопросы, ни счёт.
+    await release_quiz(chat_id, state)
     data = await state.get_data()
+    for key in ('quiz_id', 'right_answers', 'current_question'):
+        data.pop(key, None)
+    await state.set_data(data)
     subject = data.get('subject')
     level = data.get('level')
 
-    await callback.bot.send_chat_action(callback.message.chat.id, 'typing')
+    # Вопросы, которые пользователь уже видел, не попадают ни из банка, ни из генерации.
+    seen_filter = await db.get_seen_filter(chat_id)
+    quiz = await question_bank.draw_quiz(subject, level, seen_filter)
+    if quiz is not None:
+        await state.update_data(quiz_id=await quiz_store.put(quiz))
+        await db.mark_questions_seen(chat_id, quiz)
+        first_question = quiz[0]
+    else:
+        await callback.bot.send_chat_action(chat_id, 'typing')
+
+        stream = quiz_stream.start(chat_id, subject, level, http_session, seen_filter)
+        task = asyncio.create_task(stream.get(0))
+        try:
+            first_question = await show_loading_animation(callback.message, task)
+        except Exception as e:
+            quiz_stream.discard(chat_id, stream)
+            await callback.message.answer('Ошибка.', reply_markup=return_to_main_markup)
+            await state.clear()
+            return
+
+        if first_question is None:
+            quiz_stream.discard(chat_id, stream)
+            await callback.message.answer("❌ Не удалось сгенерировать викторину. Попробуйте снова позже.", reply_markup=return_to_main_markup)
+            await state.clear()
+            return
+
+        saver = asyncio.create_task(save_streamed_quiz(chat_id, stream, state))
+        background_tasks.add(saver)
+        saver.add_done_callback(background_tasks.discard)
+
+    await state.set_state(states.QuizState.current_question)
+    await send_question(callback.message, 0, first_question)
 
-    task = asyncio.create_task(generate_quiz(subject, level))
-    try:
-        quiz = await show_loading_animation(callback.message, task)
-    except Exception as e:
-        await callback.message.answer('Ошибка.', reply_markup=return_to_main_markup)
-        await state.clear()
-        return
 
-    if not quiz or len(quiz) != 10 or not all(isinstance(q, list) and len(q) == 4 for q in quiz):
-        await callback.message.answer("❌ Не удалось сгенерировать викторину. Попробуйте снова позже.", reply_markup=return_to_main_markup)
-        await state.clear()
+async def save_streamed_quiz(chat_id: int, stream: quiz_stream.QuizStream, state: FSMContext) -> None:
+    """Move a fully streamed quiz into the quiz store once generation is over."""
+    questions = await stream.wait_done()
+    if questions:
+        await db.mark_questions_seen(chat_id, questions)
+    if quiz_stream.get(chat_id) is not stream or len(questions) != QUIZ_SIZE:
+        return
+    quiz_id = await quiz_store.put(questions)
+    if quiz_stream.get(chat_id) is not stream:
+        await quiz_store.release(quiz_id)
         return
+    await state.update_data(quiz_id=quiz_id)
+    quiz_stream.discard(chat_id, stream)
+
+
+async def get_question(chat_id: int, data: dict, index: int) -> list | None:
+    """Return question number `index`, waiting for the stream if it is not generated yet."""
+    quiz_id = data.get('quiz_id')
+    if quiz_id is not None:
+        quiz = await quiz_store.get(quiz_id)
+        return quiz[index] if quiz and index < len(quiz) else None
+
+    stream = quiz_stream.get(chat_id)
+    if stream is None:
+        return None
+    return await stream.get(index)
 
-    await state.update_data(quiz=quiz)
 
-    message_question = f"Вопрос №1.\n\n {quiz[0][0]}"
+async def quiz_length(chat_id: int, data: dict) -> int | None:
+    """Return how many questions the quiz has, or None while it is still being generated."""
+    quiz_id = data.get('quiz_id')
+    if quiz_id is not None:
+        quiz = await quiz_store.get(quiz_id)
+        return len(quiz) if quiz else None
+
+    stream = quiz_stream.get(chat_id)
+    return len(stream.questions) if stream is not None and stream.done else None
+
+
+async def send_question(message: Message, index: int, question: list) -> None:
+    """Send a question with its answer options as inline buttons."""
+    message_question = f"Вопрос №{index + 1}.\n\n {question[0]}"
     keyboard_question = InlineKeyboardMarkup(
         inline_keyboard=[
             [
                 InlineKeyboardButton(
                     text=str(ans),
-                    callback_data=f'answer_0:{str(a).lower()}',
-
+                    callback_data=f'answer_{index}:{str(a).lower()}'
                 )
-            ] for a, ans in quiz[0][1].items()
+            ] for a, ans in question[1].items()
         ]
     )
-
-    await state.set_state(states.QuizState.current_question)
-    await callback.message.answer(message_question, reply_markup=keyboard_question)
+    await message.answer(message_question, reply_markup=keyboard_question)
 
 
 @quiz_router.callback_query(F.data.startswith('answer_'), states.QuizState.current_question)
@@ -121,21 +186,21 @@ async def check_answer(callback: CallbackQuery, state: FSMContext) -> None:
     answer_num, answer = callback.data.replace('answer_', '').split(':')
 
     data = await state.get_data()
-    quiz = data.get('quiz')
 
     answer_num, answer = int(answer_num), answer.strip().lower()
-    if not quiz or answer_num >= len(quiz):
+    question = await get_question(callback.message.chat.id, data, answer_num)
+    if not question:
         await callback.answer("⚠️ Викторина уже завершена. Начните новую из меню.")
         return
-    if answer_isright(answer_num, answer, quiz):
+    if answer_isright(question, answer):
         data = await state.get_data()
         right_answers = data.get('right_answers', 0) + 1
         await state.update_data(right_answers=right_answers, current_question=answer_num)
         await callback.message.edit_text("✅ Правильно!", reply_markup=None)
 
     else:
-        correct_answer = quiz[answer_num][2]
-        explanation = quiz[answer_num][3]
+        correct_answer = question[2]
+        explanation = question[3]
         await state.update_data(current_question=answer_num)
         await callback.message.edit_text(
             f"❌ Неправильно!\n\n"
@@ -144,7 +209,8 @@ async def check_answer(callback: CallbackQuery, state: FSMContext) -> None:
             reply_markup=None
         )
 
-    if answer_num == 9:
+    # Генерация могла закончиться раньше: тогда последний вопрос не десятый.
+    if answer_num + 1 >= (await quiz_length(callback.message.chat.id, data) or QUIZ_SIZE):
         await finish_quiz(callback, state)
         return
 
@@ -157,34 +223,28 @@ async def check_answer(callback: CallbackQuery, state: FSMContext) -> None:
 async def next_question(callback: CallbackQuery, state: FSMContext) -> None:
     """Send the next question or finish the quiz."""
     data = await state.get_data()
-    quiz = data.get('quiz')
+    chat_id = callback.message.chat.id
 
-    if not quiz:
+    if 'quiz_id' not in data and quiz_stream.get(chat_id) is None:
         await callback.answer("⚠️ Викторина уже завершена. Начните новую из меню.")
         return
 
     current_qst_num = data.get('current_question', 0)
 
-    if current_qst_num >= 9:
+    if current_qst_num >= QUIZ_SIZE - 1:
         await finish_quiz(callback, state)
         return
 
     next_qst_num = current_qst_num + 1
 
-    if next_qst_num < 10:
-        message_question = f"Вопрос №{next_qst_num + 1}.\n\n {quiz[next_qst_num][0]}"
-        keyboard_question = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(
-                        text=str(ans),
-                        callback_data=f'answer_{next_qst_num}:{str(a).lower()}'
-                    )
-                ] for a, ans in quiz[next_qst_num][1].items()
-            ]
-        )
+    stream = quiz_stream.get(chat_id)
+    if stream and next_qst_num >= len(stream.questions) and not stream.done:
+        await callback.bot.send_chat_action(chat_id, 'typing')
+
+    question = await get_question(chat_id, data, next_qst_num)
+    if question:
         await state.update_data(current_question=next_qst_num)
-        await callback.message.answer(message_question, reply_markup=keyboard_question)
+        await send_question(callback.message, next_qst_num, question)
     else:
         await finish_quiz(callback, state)
 
@@ -198,6 +258,7 @@ async def return_to_main(callback: CallbackQuery) -> None:
 @quiz_router.callback_query(F.data == 'next_quiz')
 async def restart_quiz(callback: CallbackQuery, state: FSMContext) -> None:
     """Restart the quiz process."""
+    await release_quiz(callback.message.chat.id, state)
     await state.clear()
     await first_step(callback.message, state)
 
@@ -208,13 +269,26 @@ async def finish_quiz(callback: CallbackQuery, state: FSMContext) -> None:
     data = await state.get_data()
     right_answers = data.get('right_answers', 0)
     subject = data.get('subject', 'unknown')
+    level = data.get('level')
+    total = await quiz_length(callback.message.chat.id, data) or QUIZ_SIZE
 
-    await callback.message.answer(
+    text = (
         f"🏁 Викторина завершена!\n\n"
-        f"Ваш результат: {right_answers}/10 правильных ответов.",
-        reply_markup=return_to_main_markup
+        f"Ваш результат: {right_answers}/{total} правильных ответов."
     )
-    db.save_stats(callback.message.chat.id, right_answers, subject)
-    db.increment_admin_stat(chat_id=callback.message.chat.id, stat_field="quizzes_taken", increment=1)
-    db.increment_admin_stat(chat_id=callback.message.chat.id, stat_field="total_score", increment=right_answers)
+    # Рейтинг считается по полным викторинам: неполная занизила бы средний балл.
+    if total < QUIZ_SIZE:
+        text += f"\n\nВопросов оказалось меньше {QUIZ_SIZE}, поэтому результат не идёт в рейтинг."
+    await callback.message.answer(text, reply_markup=return_to_main_markup)
+    if total >= QUIZ_SIZE:
+        await db.complete_quiz(callback.message.chat.id, right_answers, subject, level)
+    await release_quiz(callback.message.chat.id, state)
     await state.clear()
+
+
+async def release_quiz(chat_id: int, state: FSMContext) -> None:
+    """Stop generation and drop the session's reference to its quiz."""
+    quiz_stream.discard(chat_id)
+    quiz_id = await state.get_value('quiz_id')
+    if quiz_id:
+        await quiz_store.release(quiz_id)
@@ -1,6 +1,6 @@
-from aiogram import types, Router, F
+from aiogram import types, Router, F, html
 
-from database.db import get_raiting
+from database.db import get_raiting, get_rank
 
 raiting_router = Router()
 
@@ -9,11 +9,16 @@ raiting_router = Router()
 async def raiting_handler(message: types.Message) -> None:
     """Handle the '🏆 Рейтинг' command."""
 
-    raiting = get_raiting()
+    raiting = await get_raiting()
     if raiting:
         text = "🏆 <b>Рейтинг пользователей:</b>\n\n"
-        for idx, (user, score) in enumerate(raiting, start=1):
-            text += f"{idx}. {user}: {score:.2f}\n"
+        for idx, (name, lastname, chat_id, score) in enumerate(raiting, start=1):
+            user = f"{name} {lastname}" if name else chat_id
+            text += f"{idx}. {html.quote(str(user))}: {score:.2f}\n"
+
+        place = get_rank(message.chat.id)
+        if place:
+            text += f"\nВаше место: {place[0]} из {place[1]}"
         await message.answer(text, parse_mode="HTML")
 
     else:
@@ -55,7 +55,7 @@ async def process_lastname(message: Message, state: FSMContext) -> None:
     last_name = data['last_name']
     user_id = message.from_user.id
 
-    saved_success = db.save_new_users(name, last_name, user_id)
+    saved_success = await db.save_new_users(name, last_name, user_id)
     await state.clear()
 
     if saved_success:
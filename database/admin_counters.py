@@ -0,0 +1,89 @@
+import asyncio
+import collections
+import logging
+import os
+
+import database.db as db
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("commands_used", "quizzes_taken", "total_score")
+FLUSH_INTERVAL = float(os.getenv("ADMIN_STATS_FLUSH_INTERVAL", "5"))
+FLUSH_THRESHOLD = int(os.getenv("ADMIN_STATS_FLUSH_THRESHOLD", "500"))
+
+# Накопленные, ещё не записанные приращения: (chat_id, поле) -> дельта.
+_pending: collections.defaultdict[tuple[int, str], int] = collections.defaultdict(int)
+# Приращения, запись которых уже отправлена в поток базы.
+_flushing: dict[tuple[int, str], int] = {}
+_flush_task: asyncio.Task | None = None
+_write_task: asyncio.Task | None = None
+
+
+def increment(chat_id: int, field: str, value: int = 1) -> None:
+    """Count an admin statistic in memory; it reaches the database on the next flush."""
+    if field not in FIELDS:
+        logger.error(f"Invalid stat field: {field}")
+        return
+    _pending[(chat_id, field)] += value
+    if len(_pending) >= FLUSH_THRESHOLD and (_flush_task is None or _flush_task.done()):
+        _start_flush()
+
+
+def _start_flush() -> None:
+    global _flush_task
+    _flush_task = asyncio.create_task(flush())
+
+
+async def _write(deltas: dict) -> None:
+    global _flushing
+    saved = None
+    try:
+        saved = await db.apply_admin_stat_deltas(deltas)
+    finally:
+        # Отменённое, ещё не начатое задание поток базы не выполнит, поэтому
+        # при отмене дельты тоже возвращаются в очередь.
+        if not saved:
+            for key, value in deltas.items():
+                _pending[key] += value
+        _flushing = {}
+
+
+async def flush() -> None:
+    """Write all pending deltas in one UPSERT transaction."""
+    global _pending, _flushing, _write_task
+    if not _pending or _flushing:
+        return
+    _flushing, _pending = dict(_pending), collections.defaultdict(int)
+    _write_task = asyncio.create_task(_write(_flushing))
+    # Отмена flush (например, воркера при остановке) не отменяет саму запись:
+    # close() дождётся её и допишет остальное.
+    await asyncio.shield(_write_task)
+
+
+async def flush_worker() -> None:
+    """Flush the counters every FLUSH_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await flush()
+
+
+async def close() -> None:
+    """Wait for an in-flight flush and write what is left."""
+    for task in (_flush_task, _write_task):
+        if task is not None and not task.done():
+            await asyncio.wait([task])
+    await flush()
+
+
+async def get_stats(chat_id: int) -> dict | None:
+    """Admin statistics of a chat, including deltas that are not flushed yet."""
+    # Дельты берём до запроса: поток базы выполняет задания по порядку, так что
+    # уже отправленная запись (_flushing) попадёт в результат, а _pending — нет.
+    unflushed = {field: _pending.get((chat_id, field), 0) for field in FIELDS}
+    row = await db.get_admin_stats(chat_id)
+    if row is None:
+        return None
+    stats = dict(zip(FIELDS, row[0])) if row else dict.fromkeys(FIELDS, 0)
+    for field in FIELDS:
+        stats[field] += unflushed[field]
+    return stats
@@ -1,46 +1,116 @@
 from aiogram.types import Message
+from concurrent.futures import ThreadPoolExecutor
+import array
+import asyncio
 import sqlite3
 import os
 import datetime
 import json
 import logging
+import time
+
+from database import ranking, registry, seen, subjects
+from services import metrics
 
 logger = logging.getLogger(__name__)
 
-db_path = os.path.join(os.path.dirname(
+db_path = os.getenv("DB_PATH") or os.path.join(os.path.dirname(
             os.path.abspath(__file__)), 'db.sqlite3')
 
+# Все обращения к SQLite идут через один поток с постоянным соединением,
+# поэтому event loop никогда не ждёт диск.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+_conn: sqlite3.Connection | None = None
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Return the persistent connection owned by the database thread."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(db_path, timeout=20, cached_statements=256)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+    return _conn
+
+
+def _close_connection() -> None:
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
 
-def connect_to_db(query: str, params=(), fetch=False) -> list | bool | None:
-    """Connect to the SQLite database and execute a query."""
-    create_db()
+
+def _execute(query: str, params=(), fetch=False) -> list | bool | None:
+    conn = _get_connection()
+    started = time.perf_counter()
     try:
-        with sqlite3.connect(db_path, timeout=20) as conn:
-            cursor = conn.execute(query, params)
-            if fetch:
-                return cursor.fetchall()
-            else:
-                conn.commit()
-                return True
+        cursor = conn.execute(query, params)
+        if fetch:
+            return cursor.fetchall()
+        conn.commit()
+        return True
     except sqlite3.Error as e:
+        conn.rollback()
         logging.error(f"Database error: {e}")
         return None
+    finally:
+        metrics.db_query_duration.observe(time.perf_counter() - started, statement=query.split(None, 1)[0].lower())
 
 
-def is_registered(message: Message) -> bool:
-    """Check if a user is registered in the database."""
-    data = connect_to_db(
-        "SELECT * FROM users WHERE chat_id = ?",
-        (message.chat.id,),
-        fetch=True
+def _timed(submitted: float, job: str | None, func, *args):
+    """Run a job on the database thread, recording its wait in the queue and its duration."""
+    started = time.perf_counter()
+    metrics.db_queue_wait.observe(started - submitted)
+    try:
+        return func(*args)
+    finally:
+        if job is not None:
+            metrics.db_job_duration.observe(time.perf_counter() - started, job=job)
+
+
+async def run_db(func, *args):
+    """Run func(connection, *args) in the database thread."""
+    loop = asyncio.get_running_loop()
+    job = func.__qualname__.replace(".<locals>", "")
+    return await loop.run_in_executor(
+        _executor, _timed, time.perf_counter(), job, lambda: func(_get_connection(), *args)
     )
-    return bool(data)
 
 
-def save_new_users(name: str, lastname: str, user_id: int) -> bool | None:
+async def connect_to_db(query: str, params=(), fetch=False) -> list | bool | None:
+    """Execute a query on the persistent connection without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _timed, time.perf_counter(), None, _execute, query, params, fetch)
+
+
+async def close_db() -> None:
+    """Close the connection and stop the database thread."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_executor, _close_connection)
+    _executor.shutdown(wait=True)
+
+
+def is_registered(message: Message) -> bool:
+    """Check if a user is registered, using the in-memory registry."""
+    return message.chat.id in registry.registry
+
+
+async def load_registered_users(batch_size: int = 10000) -> None:
+    """Fill the registry with all registered chat_ids, streaming them in batches."""
+    def _load(conn: sqlite3.Connection) -> array.array:
+        ids = array.array('q')
+        cursor = conn.execute("SELECT chat_id FROM users WHERE chat_id IS NOT NULL ORDER BY chat_id")
+        while rows := cursor.fetchmany(batch_size):
+            ids.extend(row[0] for row in rows)
+        return ids
+
+    registry.registry.replace(await run_db(_load))
+
+
+async def save_new_users(name: str, lastname: str, user_id: int) -> bool | None:
     """Save new user information to the database."""
     try:
-        return connect_to_db(
+        saved = await connect_to_db(
             "INSERT INTO users (name, lastname, chat_id) VALUES (?, ?, ?)",
             (name, lastname, user_id),
             fetch=False
@@ -48,14 +118,17 @@ def save_new_users(name: str, lastname: str, user_id: int) -> bool | None:
     except Exception as e:
         logging.error(e)
         return None
+    if saved:
+        registry.registry.add(user_id)
+    return saved
 
 
-def get_stats(chat_id: int) -> list | None:
-    """Retrieve user statistics from the database."""
+async def get_stats(chat_id: int, since: datetime.date | None = None) -> list | None:
+    """Retrieve (subject, day, total, cnt) daily score sums of a user, oldest first."""
     try:
-        return connect_to_db(
-            "SELECT statistics FROM users WHERE chat_id=?",
-            (chat_id,),
+        return await connect_to_db(
+            "SELECT subject, day, total, cnt FROM daily_scores WHERE chat_id = ? AND day >= ? ORDER BY subject, day",
+            (chat_id, since.isoformat() if since else ""),
             fetch=True
         )
     except Exception as e:
@@ -63,49 +136,65 @@ def get_stats(chat_id: int) -> list | None:
         return None
 
 
-def save_stats(chat_id: int, score: int, subject: str) -> bool | None:
-    """Save user statistics to the database."""
-    try:
-        stats_row = get_stats(chat_id)
-        subject = subject.lower()
-        today = datetime.date.today()
-        month = str(today.month)
-        day = str(today.day)
-        time_now = str(datetime.datetime.now().time())
+async def complete_quiz(chat_id: int, score: int, subject: str, level: str | None = None) -> bool | None:
+    """Record a finished quiz, the rating and the admin counters in one transaction."""
+    def _complete(conn: sqlite3.Connection) -> float:
+        now = datetime.datetime.now()
+        with conn:
+            conn.execute(
+                "INSERT INTO quiz_attempts (chat_id, subject, level, score, ts) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, subject.lower(), level, score, _format_ts(now))
+            )
+            conn.execute(
+                """
+                INSERT INTO daily_scores (chat_id, day, subject, total, cnt) VALUES (?, ?, ?, ?, 1)
+                ON CONFLICT(chat_id, day, subject) DO UPDATE SET
+                    total = total + excluded.total,
+                    cnt = cnt + 1
+                """,
+                (chat_id, now.date().isoformat(), subject.lower(), score)
+            )
+            avg = _upsert_raiting(conn, chat_id, score)
+            conn.execute(
+                """
+                INSERT INTO admin_stats (chat_id, quizzes_taken, total_score) VALUES (?, 1, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET
+                    quizzes_taken = quizzes_taken + 1,
+                    total_score = total_score + excluded.total_score
+                """,
+                (chat_id, score)
+            )
+        return avg
 
-        if stats_row and stats_row[0] and stats_row[0][0]:
-            current_stats = json.loads(stats_row[0][0])
-        else:
-            current_stats = {}
+    try:
+        avg = await run_db(_complete)
+    except Exception as e:
+        logging.error(e)
+        return None
+    ranking.index.update(chat_id, avg)
+    ranking.invalidate_top()
+    return True
 
-        if subject not in current_stats:
-            current_stats[subject] = {}
 
-        subject_stats = current_stats[subject]
+def _format_ts(moment: datetime.datetime) -> str:
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
 
-        if month not in subject_stats:
-            subject_stats[month] = {}
-        if day not in subject_stats[month]:
-            subject_stats[month][day] = {}
 
-        subject_stats[month][day][time_now] = score
-        current_stats[subject] = subject_stats
+async def create_db() -> None:
+    """Create the database and users table if they do not exist."""
+    await run_db(_create_db)
+    await load_caches()
 
-        update_raiting(chat_id, score)
 
-        return connect_to_db(
-            "UPDATE users SET statistics = ? WHERE chat_id = ?",
-            (json.dumps(current_stats), chat_id),
-            fetch=False
-        )
-    except Exception as e:
-        logging.error(e)
-        return None
+async def load_caches() -> None:
+    """(Re)load the in-memory copies of the rating, subjects and registered users."""
+    await load_ranking()
+    await load_subjects()
+    await load_registered_users()
 
 
-def create_db() -> None:
-    """Create the database and users table if they do not exist."""
-    with sqlite3.connect(db_path) as conn:
+def _create_db(conn: sqlite3.Connection) -> None:
+    with conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -124,6 +213,10 @@ def create_db() -> None:
             avg_score REAL DEFAULT 0
             )
         """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_raiting_avg_score
+            ON raiting (avg_score DESC)
+        """)
         conn.execute("""
             CREATE TABLE IF NOT EXISTS admin_stats (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -139,6 +232,71 @@ def create_db() -> None:
                 subject TEXT UNIQUE
             )
         """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS quiz_attempts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                subject TEXT NOT NULL,
+                level TEXT,
+                score INTEGER NOT NULL,
+                ts TEXT NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_quiz_attempts_chat_subject_ts
+            ON quiz_attempts (chat_id, subject, ts)
+        """)
+        # Суммы баллов за день для графика статистики; ключ начинается с
+        # (chat_id, day), чтобы окно последних дней читалось одним диапазоном.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS daily_scores (
+                chat_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                cnt INTEGER NOT NULL,
+                PRIMARY KEY (chat_id, day, subject)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS question_bank (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subject TEXT NOT NULL,
+                level TEXT NOT NULL,
+                question TEXT NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_question_bank_subject_level
+            ON question_bank (subject, level, id)
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS quizzes (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                refs INTEGER DEFAULT 0,
+                last_used REAL
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_quizzes_last_used
+            ON quizzes (last_used)
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_questions (
+                chat_id INTEGER PRIMARY KEY,
+                current BLOB NOT NULL,
+                previous BLOB NOT NULL,
+                count INTEGER NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data BLOB
+            )
+        """)
         conn.execute("""
                     INSERT OR IGNORE INTO subjects (subject) VALUES
                     ('математика'),
@@ -151,92 +309,237 @@ def create_db() -> None:
                     ('литература'),
                     ('английский язык')
                     """)
-        conn.commit()
+    _migrate_statistics(conn)
+    _backfill_daily_scores(conn)
 
 
-def update_raiting(chat_id: int, score: int) -> bool | None:
-    try:
-        row = connect_to_db("SELECT total_score, attempts FROM raiting WHERE chat_id = ?", (chat_id,), fetch=True)
-        if row and len(row) > 0:
-            total, attempts = row[0]
-            total = (total or 0) + score
-            attempts = (attempts or 0) + 1
-            avg = total / attempts
-            return connect_to_db(
-                "UPDATE raiting SET total_score = ?, attempts = ?, avg_score = ? WHERE chat_id = ?",
-                (total, attempts, avg, chat_id),
-                fetch=False
-            )
-        else:
-            return connect_to_db(
-                "INSERT INTO raiting (chat_id, total_score, attempts, avg_score) VALUES (?, ?, ?, ?)",
-                (chat_id, score, 1, score),
-                fetch=False
+def _migrate_statistics(conn: sqlite3.Connection, batch_size: int = 500) -> None:
+    """Move legacy users.statistics JSON blobs into quiz_attempts in batches.
+
+    The old blobs are keyed subject -> month -> day -> time without a year,
+    so the current year is assumed, as the old chart code did. A migrated
+    blob is cleared, which makes the migration a no-op on later starts.
+    """
+    year = datetime.date.today().year
+    last_id = 0
+    migrated = 0
+    while True:
+        users = conn.execute(
+            "SELECT id, chat_id, statistics FROM users WHERE statistics IS NOT NULL AND id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()
+        if not users:
+            break
+
+        attempts = []
+        done_ids = []
+        for user_id, chat_id, statistics in users:
+            last_id = user_id
+            try:
+                user_attempts = [
+                    (chat_id, subject, None, score, f"{year}-{int(month):02d}-{int(day):02d} {time_str[:8]}")
+                    for subject, months in json.loads(statistics).items()
+                    for month, days in months.items()
+                    for day, times in days.items()
+                    for time_str, score in times.items()
+                ]
+            except Exception as e:
+                logger.error("Skipping malformed statistics of user %s: %s", chat_id, e)
+                continue
+            attempts.extend(user_attempts)
+            done_ids.append((user_id,))
+
+        with conn:
+            conn.executemany(
+                "INSERT INTO quiz_attempts (chat_id, subject, level, score, ts) VALUES (?, ?, ?, ?, ?)",
+                attempts
             )
+            conn.executemany("UPDATE users SET statistics = NULL WHERE id = ?", done_ids)
+        migrated += len(done_ids)
+
+    if migrated:
+        logger.info("Migrated statistics of %s users into quiz_attempts.", migrated)
+
+
+def _backfill_daily_scores(conn: sqlite3.Connection) -> None:
+    """Fill daily_scores from quiz_attempts once, when the table is new and empty.
+
+    After that complete_quiz keeps it up to date.
+    """
+    if conn.execute("SELECT 1 FROM daily_scores LIMIT 1").fetchone():
+        return
+    with conn:
+        cursor = conn.execute("""
+            INSERT INTO daily_scores (chat_id, day, subject, total, cnt)
+            SELECT chat_id, substr(ts, 1, 10), subject, SUM(score), COUNT(*)
+            FROM quiz_attempts
+            GROUP BY chat_id, substr(ts, 1, 10), subject
+        """)
+    if cursor.rowcount > 0:
+        logger.info("Backfilled %s daily score rows from quiz_attempts.", cursor.rowcount)
+
+
+async def update_raiting(chat_id: int, score: int) -> bool | None:
+    try:
+        avg = await run_db(lambda conn: _commit(conn, _upsert_raiting, chat_id, score))
     except Exception as e:
         logger.error("Failed to update rating: %s", e)
         return None
+    ranking.index.update(chat_id, avg)
+    ranking.invalidate_top()
+    return True
 
 
-def get_raiting() -> list | None:
-    """Retrieve the rating list from the database."""
+def _upsert_raiting(conn: sqlite3.Connection, chat_id: int, score: int) -> float:
+    """Add one attempt to the user's rating without a read round trip; returns the new average."""
+    conn.execute(
+        """
+        INSERT INTO raiting (chat_id, total_score, attempts, avg_score) VALUES (?, ?, 1, ?)
+        ON CONFLICT(chat_id) DO UPDATE SET
+            total_score = total_score + excluded.total_score,
+            attempts = attempts + 1,
+            avg_score = CAST(total_score + excluded.total_score AS REAL) / (attempts + 1)
+        """,
+        (chat_id, score, score)
+    )
+    return conn.execute("SELECT avg_score FROM raiting WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+
+
+def _commit(conn: sqlite3.Connection, func, *args):
+    with conn:
+        return func(conn, *args)
+
+
+async def get_raiting() -> list | None:
+    """Retrieve the top 10 as (name, lastname, chat_id, avg_score), cached until the rating changes."""
+    if ranking.top_cache is not None:
+        return ranking.top_cache
     try:
-        return connect_to_db(
-            "SELECT chat_id, scores FROM raiting ORDER BY scores DESC LIMIT 10",
+        rows = await connect_to_db(
+            """
+            SELECT users.name, users.lastname, raiting.chat_id, raiting.avg_score
+            FROM raiting LEFT JOIN users ON users.chat_id = raiting.chat_id
+            ORDER BY raiting.avg_score DESC LIMIT 10
+            """,
             fetch=True
         )
     except Exception as e:
         logging.error(e)
         return None
+    if rows is not None:
+        ranking.top_cache = rows
+    return rows
+
+
+def get_rank(chat_id: int) -> tuple[int, int] | None:
+    """Return the user's (place, total) in the rating without touching the database."""
+    return ranking.index.rank(chat_id)
+
+
+async def load_ranking() -> None:
+    """Fill the in-memory rating index from the raiting table."""
+    def _load(conn: sqlite3.Connection) -> list:
+        return conn.execute("SELECT chat_id, avg_score FROM raiting").fetchall()
+
+    for chat_id, avg_score in await run_db(_load):
+        ranking.index.update(chat_id, avg_score or 0)
+    ranking.invalidate_top()
     
-def increment_admin_stat(chat_id: int, stat_field: str, increment: int = 1) -> bool | None:
+async def increment_admin_stat(chat_id: int, stat_field: str, increment: int = 1) -> bool | None:
     """Increment a specific admin statistic field for a given chat_id."""
     valid_fields = {"commands_used", "quizzes_taken", "total_score"}
     if stat_field not in valid_fields:
         logging.error(f"Invalid stat field: {stat_field}")
         return None
+    return await apply_admin_stat_deltas({(chat_id, stat_field): increment})
+
+
+async def apply_admin_stat_deltas(deltas: dict) -> bool | None:
+    """Add {(chat_id, field): delta} to admin_stats in one UPSERT transaction."""
+    rows = {}
+    for (chat_id, stat_field), increment in deltas.items():
+        row = rows.setdefault(chat_id, {"commands_used": 0, "quizzes_taken": 0, "total_score": 0})
+        row[stat_field] += increment
+
+    def _apply(conn: sqlite3.Connection) -> bool:
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO admin_stats (chat_id, commands_used, quizzes_taken, total_score) VALUES (?, ?, ?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET
+                    commands_used = commands_used + excluded.commands_used,
+                    quizzes_taken = quizzes_taken + excluded.quizzes_taken,
+                    total_score = total_score + excluded.total_score
+                """,
+                [(chat_id, row["commands_used"], row["quizzes_taken"], row["total_score"]) for chat_id, row in rows.items()]
+            )
+        return True
+
+    try:
+        return await run_db(_apply)
+    except Exception as e:
+        logging.error(e)
+        return None
+
 
+async def get_admin_stats(chat_id: int) -> list | None:
+    """Retrieve (commands_used, quizzes_taken, total_score) of a chat as stored in the database."""
     try:
-        existing = connect_to_db(
-            f"SELECT {stat_field} FROM admin_stats WHERE chat_id = ?",
+        return await connect_to_db(
+            "SELECT commands_used, quizzes_taken, total_score FROM admin_stats WHERE chat_id = ?",
             (chat_id,),
             fetch=True
         )
-        if existing:
-            new_value = existing[0][0] + increment
-            return connect_to_db(
-                f"UPDATE admin_stats SET {stat_field} = ? WHERE chat_id = ?",
-                (new_value, chat_id),
-                fetch=False
-            )
-        else:
-            initial_values = {field: 0 for field in valid_fields}
-            initial_values[stat_field] = increment
-            return connect_to_db(
-                "INSERT INTO admin_stats (chat_id, commands_used, quizzes_taken, total_score) VALUES (?, ?, ?, ?)",
-                (chat_id, initial_values["commands_used"], initial_values["quizzes_taken"], initial_values["total_score"]),
-                fetch=False
-            )
     except Exception as e:
         logging.error(e)
         return None
 
 
-def get_all_users() -> list | None:
+async def get_all_users() -> list | None:
     """Retrieve all users from the database."""
     try:
-        return connect_to_db(
-            "SELECT id, name, lastname, chat_id, statistics FROM users",
+        return await connect_to_db(
+            "SELECT id, name, lastname, chat_id FROM users",
             fetch=True
         )
     except Exception as e:
         logging.error(e)
         return None
     
-def delete_user(user_id: int) -> bool | None:
+async def get_users_page(after_id: int = 0, limit: int = 5) -> list | None:
+    """Retrieve the next page of users with id greater than after_id."""
+    try:
+        return await connect_to_db(
+            "SELECT id, name, lastname, chat_id FROM users WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+            fetch=True
+        )
+    except Exception as e:
+        logging.error(e)
+        return None
+
+
+async def get_stats_for_users(chat_ids: list, since: datetime.date | None = None) -> list | None:
+    """Retrieve (chat_id, subject, day, total, cnt) daily score sums of several users in one query."""
+    if not chat_ids:
+        return []
+    placeholders = ", ".join("?" for _ in chat_ids)
+    try:
+        return await connect_to_db(
+            f"SELECT chat_id, subject, day, total, cnt FROM daily_scores "
+            f"WHERE chat_id IN ({placeholders}) AND day >= ? ORDER BY chat_id, subject, day",
+            (*chat_ids, since.isoformat() if since else ""),
+            fetch=True
+        )
+    except Exception as e:
+        logging.error(e)
+        return None
+
+
+async def delete_user(user_id: int) -> bool | None:
     """Delete a user from the database by their chat_id."""
     try:
-        return connect_to_db(
+        deleted = await connect_to_db(
             "DELETE FROM users WHERE chat_id = ?",
             (user_id,),
             fetch=False
@@ -244,12 +547,15 @@ def delete_user(user_id: int) -> bool | None:
     except Exception as e:
         logging.error(e)
         return None
+    if deleted:
+        registry.registry.remove(user_id)
+    return deleted
 
 
-def get_subjects() -> list | None:
+async def get_subjects() -> list | None:
     """Retrieve all quiz subjects from the database."""
     try:
-        return connect_to_db(
+        return await connect_to_db(
             "SELECT subject FROM subjects",
             fetch=True
         )
@@ -257,10 +563,17 @@ def get_subjects() -> list | None:
         logging.error(e)
         return None
     
-def add_subject(subject: str) -> bool | None:
+async def load_subjects() -> None:
+    """Fill the subject catalog from the subjects table."""
+    rows = await get_subjects()
+    if rows is not None:
+        subjects.catalog.replace(row[0] for row in rows)
+
+
+async def add_subject(subject: str) -> bool | None:
     """Add a new subject to the database."""
     try:
-        return connect_to_db(
+        saved = await connect_to_db(
             "INSERT INTO subjects (subject) VALUES (?)",
             (subject.lower(),),
             fetch=False
@@ -268,11 +581,14 @@ def add_subject(subject: str) -> bool | None:
     except Exception as e:
         logging.error(e)
         return None
+    if saved:
+        subjects.catalog.add(subject)
+    return saved
     
-def delete_subject(subject: str) -> bool | None:
+async def delete_subject(subject: str) -> bool | None:
     """Delete a subject from the database."""
     try:
-        return connect_to_db(
+        deleted = await connect_to_db(
             "DELETE FROM subjects WHERE subject = ?",
             (subject.lower(),),
             fetch=False
@@ -280,3 +596,107 @@ def delete_subject(subject: str) -> bool | None:
     except Exception as e:
         logging.error(e)
         return None
+    if deleted:
+        subjects.catalog.remove(subject)
+    return deleted
+
+
+async def get_question_bank_depth() -> list | None:
+    """Return (subject, level, count) for every non-empty question pool."""
+    try:
+        return await connect_to_db(
+            "SELECT subject, level, COUNT(*) FROM question_bank GROUP BY subject, level",
+            fetch=True
+        )
+    except Exception as e:
+        logging.error(e)
+        return None
+
+
+async def add_bank_questions(subject: str, level: str, questions: list) -> bool | None:
+    """Store generated questions in the (subject, level) pool."""
+    def _add(conn: sqlite3.Connection) -> bool:
+        with conn:
+            conn.executemany(
+                "INSERT INTO question_bank (subject, level, question) VALUES (?, ?, ?)",
+                [(subject.lower(), level, json.dumps(q, ensure_ascii=False)) for q in questions]
+            )
+        return True
+
+    try:
+        return await run_db(_add)
+    except Exception as e:
+        logging.error(e)
+        return None
+
+
+async def take_bank_questions(subject: str, level: str, count: int,
+                              seen_filter: seen.SeenFilter | None = None, scan_limit: int = 500) -> list | None:
+    """Remove and return `count` questions from the pool, or None if it has fewer.
+
+    Questions in `seen_filter` are skipped and stay in the pool for other users;
+    at most `scan_limit` rows are looked at.
+    """
+    def _take(conn: sqlite3.Connection) -> list | None:
+        with conn:
+            # Сразу берём блокировку записи: иначе другой процесс может удалить
+            # те же строки между SELECT и DELETE.
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "SELECT id, question FROM question_bank WHERE subject = ? AND level = ? ORDER BY id LIMIT ?",
+                (subject.lower(), level, count if seen_filter is None else scan_limit)
+            )
+            taken = []
+            while len(taken) < count and (row := cursor.fetchone()):
+                question = json.loads(row[1])
+                if seen_filter is None or not seen_filter.seen(question):
+                    taken.append((row[0], question))
+            cursor.close()
+            if len(taken) < count:
+                return None
+            conn.executemany("DELETE FROM question_bank WHERE id = ?", [(row_id,) for row_id, _ in taken])
+        return [question for _, question in taken]
+
+    try:
+        return await run_db(_take)
+    except Exception as e:
+        logging.error(e)
+        return None
+
+
+async def get_seen_filter(chat_id: int) -> seen.SeenFilter:
+    """Load the filter of questions already served to the user (empty for a new user)."""
+    try:
+        rows = await connect_to_db(
+            "SELECT current, previous, count FROM seen_questions WHERE chat_id = ?",
+            (chat_id,),
+            fetch=True
+        )
+    except Exception as e:
+        logging.error(e)
+        rows = None
+    return seen.SeenFilter(*rows[0]) if rows else seen.SeenFilter()
+
+
+async def mark_questions_seen(chat_id: int, questions: list) -> bool | None:
+    """Add questions to the user's seen filter; read-modify-write in one transaction."""
+    def _mark(conn: sqlite3.Connection) -> bool:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT current, previous, count FROM seen_questions WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            seen_filter = seen.SeenFilter(*row) if row else seen.SeenFilter()
+            for question in questions:
+                seen_filter.add(seen.fingerprint(question[0]))
+            conn.execute(
+                "INSERT OR REPLACE INTO seen_questions (chat_id, current, previous, count) VALUES (?, ?, ?, ?)",
+                (chat_id, *seen_filter.dump())
+            )
+        return True
+
+    try:
+        return await run_db(_mark)
+    except Exception as e:
+        logging.error(e)
+        return None
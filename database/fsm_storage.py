@@ -0,0 +1,173 @@
+import asyncio
+import collections
+import copy
+import json
+import logging
+import sqlite3
+import zlib
+from collections.abc import Mapping
+from typing import Any
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import database.db as db
+
+logger = logging.getLogger(__name__)
+
+# Данные длиннее порога сжимаются zlib; первый байт записи говорит, как её читать.
+_COMPRESS_THRESHOLD = 512
+_RAW = b"j"
+_ZLIB = b"z"
+
+
+def dumps(data: dict) -> bytes:
+    """Serialize FSM data as compact JSON, compressed when it is large."""
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) > _COMPRESS_THRESHOLD:
+        return _ZLIB + zlib.compress(raw)
+    return _RAW + raw
+
+
+def loads(blob: bytes | None) -> dict:
+    if not blob:
+        return {}
+    if blob[:1] == _ZLIB:
+        return json.loads(zlib.decompress(blob[1:]))
+    return json.loads(blob[1:])
+
+
+class _Record:
+    __slots__ = ("state", "data")
+
+    def __init__(self, state: str | None = None, data: dict | None = None) -> None:
+        self.state = state
+        self.data = data if data is not None else {}
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage that survives restarts, kept in the bot's SQLite database.
+
+    Hot chats are served from an in-memory LRU, so get_state/get_data never
+    wait for the disk. Changes are written behind: they are collected for
+    `flush_interval` seconds and saved in one transaction, and close()
+    flushes whatever is still pending.
+    """
+
+    def __init__(self, cache_size: int = 10000, flush_interval: float = 0.05,
+                 key_builder: KeyBuilder | None = None) -> None:
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._cache: collections.OrderedDict[str, _Record] = collections.OrderedDict()
+        self._dirty: dict[str, _Record] = {}
+        self._loading: dict[str, asyncio.Future] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    async def _record(self, key: StorageKey) -> tuple[str, _Record]:
+        storage_key = self.key_builder.build(key)
+        record = self._cache.get(storage_key)
+        if record is not None:
+            self._cache.move_to_end(storage_key)
+            return storage_key, record
+
+        record = self._dirty.get(storage_key)
+        if record is None:
+            loading = self._loading.get(storage_key)
+            if loading is not None:
+                return storage_key, await asyncio.shield(loading)
+            loading = self._loading[storage_key] = asyncio.get_running_loop().create_future()
+            try:
+                row = await db.run_db(_load_row, storage_key)
+                record = _Record(row[0], loads(row[1])) if row else _Record()
+                loading.set_result(record)
+            except asyncio.CancelledError:
+                loading.cancel()
+                raise
+            except Exception as e:
+                loading.set_exception(e)
+                raise
+            finally:
+                del self._loading[storage_key]
+
+        self._cache[storage_key] = record
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return storage_key, record
+
+    def _mark_dirty(self, storage_key: str, record: _Record) -> None:
+        self._dirty[storage_key] = record
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write every pending change in one transaction."""
+        if not self._dirty:
+            return
+        # The database thread runs jobs in order, so a record evicted from the
+        # cache and reloaded after this point is read after it is saved.
+        pending, self._dirty = self._dirty, {}
+        rows = [
+            (storage_key, record.state, dumps(record.data) if record.data else None)
+            for storage_key, record in pending.items()
+        ]
+        try:
+            await db.run_db(_save_rows, rows)
+        except Exception as e:
+            logger.error("Failed to flush FSM storage: %s", e)
+            for storage_key, record in pending.items():
+                self._dirty.setdefault(storage_key, record)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(storage_key, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, record = await self._record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        storage_key, record = await self._record(key)
+        record.data = data.copy()
+        self._mark_dirty(storage_key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, record = await self._record(key)
+        return record.data.copy()
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Any | None = None) -> Any | None:
+        _, record = await self._record(storage_key)
+        return copy.copy(record.data.get(dict_key, default))
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self.flush()
+
+
+def _load_row(conn: sqlite3.Connection, storage_key: str) -> tuple | None:
+    return conn.execute("SELECT state, data FROM fsm_storage WHERE key = ?", (storage_key,)).fetchone()
+
+
+def _save_rows(conn: sqlite3.Connection, rows: list) -> None:
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO fsm_storage (key, state, data) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data
+            """,
+            [row for row in rows if row[1] is not None or row[2] is not None]
+        )
+        conn.executemany(
+            "DELETE FROM fsm_storage WHERE key = ?",
+            [(row[0],) for row in rows if row[1] is None and row[2] is None]
+        )
@@ -0,0 +1,101 @@
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import database.db as db
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = int(os.getenv("QUIZ_STORE_CACHE_SIZE", "2000"))
+# Квиз без ссылок удаляется через QUIZ_STORE_TTL секунд, брошенный сессией — через QUIZ_STORE_MAX_AGE.
+TTL = float(os.getenv("QUIZ_STORE_TTL", "3600"))
+MAX_AGE = float(os.getenv("QUIZ_STORE_MAX_AGE", str(7 * 24 * 3600)))
+EVICT_INTERVAL = float(os.getenv("QUIZ_STORE_EVICT_INTERVAL", "600"))
+
+_cache: collections.OrderedDict[str, list] = collections.OrderedDict()
+
+
+def _encode(quiz: list) -> str:
+    return json.dumps(quiz, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+def _remember(quiz_id: str, quiz: list) -> None:
+    _cache[quiz_id] = quiz
+    _cache.move_to_end(quiz_id)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+async def put(quiz: list) -> str:
+    """Store a quiz once under the hash of its content and take a reference to it."""
+    payload = _encode(quiz)
+    quiz_id = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+    def _put(conn: sqlite3.Connection) -> None:
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO quizzes (id, payload, refs, last_used) VALUES (?, ?, 1, ?)
+                ON CONFLICT(id) DO UPDATE SET refs = refs + 1, last_used = excluded.last_used
+                """,
+                (quiz_id, payload, time.time())
+            )
+
+    await db.run_db(_put)
+    _remember(quiz_id, quiz)
+    return quiz_id
+
+
+async def get(quiz_id: str) -> list | None:
+    """Return a stored quiz. Callers must treat it as immutable."""
+    quiz = _cache.get(quiz_id)
+    if quiz is not None:
+        _cache.move_to_end(quiz_id)
+        return quiz
+
+    row = await db.connect_to_db("SELECT payload FROM quizzes WHERE id = ?", (quiz_id,), fetch=True)
+    if not row:
+        return None
+    quiz = json.loads(row[0][0])
+    _remember(quiz_id, quiz)
+    return quiz
+
+
+async def release(quiz_id: str) -> None:
+    """Drop a reference; the quiz is evicted TTL seconds after the last one."""
+    await db.connect_to_db(
+        "UPDATE quizzes SET refs = MAX(refs - 1, 0), last_used = ? WHERE id = ?",
+        (time.time(), quiz_id)
+    )
+
+
+async def evict_expired() -> None:
+    now = time.time()
+
+    def _evict(conn: sqlite3.Connection) -> list:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = conn.execute(
+                "SELECT id FROM quizzes WHERE (refs <= 0 AND last_used < ?) OR last_used < ?",
+                (now - TTL, now - MAX_AGE)
+            ).fetchall()
+            conn.executemany("DELETE FROM quizzes WHERE id = ?", ids)
+        return [row[0] for row in ids]
+
+    for quiz_id in await db.run_db(_evict):
+        _cache.pop(quiz_id, None)
+
+
+async def eviction_worker() -> None:
+    """Periodically remove expired quizzes."""
+    while True:
+        try:
+            await evict_expired()
+        except Exception as e:
+            logger.error("Quiz store eviction failed: %s", e)
+        await asyncio.sleep(EVICT_INTERVAL)
@@ -0,0 +1,67 @@
+class ScoreIndex:
+    """Order-statistics index over users' average scores.
+
+    Scores are bucketed to `resolution` steps (0.01 by default, the precision
+    shown in the rating) and counted in a Fenwick tree, so updating a user and
+    answering "place k of N" both take O(log buckets). Users with equal
+    rounded scores share a place.
+    """
+
+    def __init__(self, max_score: int = 10, resolution: int = 100) -> None:
+        self._resolution = resolution
+        self._size = max_score * resolution + 1
+        self._tree = [0] * (self._size + 1)
+        self._buckets: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _bucket(self, score: float) -> int:
+        return min(self._size - 1, max(0, round(score * self._resolution)))
+
+    def _add(self, bucket: int, delta: int) -> None:
+        i = bucket + 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_up_to(self, bucket: int) -> int:
+        total = 0
+        i = bucket + 1
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def update(self, chat_id: int, score: float) -> None:
+        """Insert a user or move them to a new score."""
+        old = self._buckets.get(chat_id)
+        if old is not None:
+            self._add(old, -1)
+        bucket = self._bucket(score)
+        self._add(bucket, 1)
+        self._buckets[chat_id] = bucket
+
+    def remove(self, chat_id: int) -> None:
+        bucket = self._buckets.pop(chat_id, None)
+        if bucket is not None:
+            self._add(bucket, -1)
+
+    def rank(self, chat_id: int) -> tuple[int, int] | None:
+        """Return (place, total) of a user, or None if they have no rating."""
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            return None
+        higher = len(self._buckets) - self._count_up_to(bucket)
+        return higher + 1, len(self._buckets)
+
+
+index = ScoreIndex()
+
+# Кэш топа рейтинга, сбрасывается при каждом изменении рейтинга.
+top_cache: list | None = None
+
+
+def invalidate_top() -> None:
+    global top_cache
+    top_cache = None
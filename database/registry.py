@@ -0,0 +1,38 @@
+import array
+import bisect
+
+
+class UserRegistry:
+    """Registered chat_ids kept in memory as a sorted array of int64.
+
+    8 bytes per user instead of ~60+ for a set of Python ints; membership is a
+    binary search. Registrations and deletions are rare compared to /start, so
+    the O(n) memmove of insert/remove is cheap in practice.
+    """
+
+    def __init__(self) -> None:
+        self._ids = array.array('q')
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, chat_id: int) -> bool:
+        i = bisect.bisect_left(self._ids, chat_id)
+        return i < len(self._ids) and self._ids[i] == chat_id
+
+    def replace(self, sorted_ids: array.array) -> None:
+        """Swap in a freshly loaded, already sorted array of chat_ids."""
+        self._ids = sorted_ids
+
+    def add(self, chat_id: int) -> None:
+        i = bisect.bisect_left(self._ids, chat_id)
+        if i == len(self._ids) or self._ids[i] != chat_id:
+            self._ids.insert(i, chat_id)
+
+    def remove(self, chat_id: int) -> None:
+        i = bisect.bisect_left(self._ids, chat_id)
+        if i < len(self._ids) and self._ids[i] == chat_id:
+            del self._ids[i]
+
+
+registry = UserRegistry()
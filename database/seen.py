@@ -0,0 +1,64 @@
+import hashlib
+import re
+
+# 16 Кбит на фильтр, два фильтра — 4 КиБ на пользователя при любом числе викторин.
+SEEN_FILTER_BITS = 1 << 14
+SEEN_FILTER_HASHES = 7
+# При 1500 отпечатках на фильтр (150 викторин) ложные срабатывания ~0,5%.
+SEEN_FILTER_CAPACITY = 1500
+
+
+def fingerprint(question: str) -> bytes:
+    """128-bit fingerprint of a question, insensitive to case, punctuation and spacing."""
+    normalized = re.sub(r"[\W_]+", " ", question.lower().replace("ё", "е")).strip()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+
+class SeenFilter:
+    """Questions a user has already been served, as a rotating pair of Bloom filters.
+
+    New fingerprints go into the current filter; once it holds `capacity` of
+    them it becomes the previous one and a fresh filter takes its place, so the
+    last 1–2 generations of questions are remembered in a fixed amount of memory.
+    Lookups and inserts touch SEEN_FILTER_HASHES bits. False positives only
+    make a question look seen.
+    """
+
+    def __init__(self, current: bytes | None = None, previous: bytes | None = None, count: int = 0,
+                 capacity: int = SEEN_FILTER_CAPACITY) -> None:
+        size = SEEN_FILTER_BITS // 8
+        self._current = bytearray(current) if current and len(current) == size else bytearray(size)
+        self._previous = bytearray(previous) if previous and len(previous) == size else bytearray(size)
+        self.count = count
+        self.capacity = capacity
+
+    @staticmethod
+    def _positions(fp: bytes):
+        h1 = int.from_bytes(fp[:8], "little")
+        h2 = int.from_bytes(fp[8:16], "little") | 1
+        return [(h1 + i * h2) % SEEN_FILTER_BITS for i in range(SEEN_FILTER_HASHES)]
+
+    @staticmethod
+    def _has(bits: bytearray, positions: list[int]) -> bool:
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def __contains__(self, fp: bytes) -> bool:
+        positions = self._positions(fp)
+        return self._has(self._current, positions) or self._has(self._previous, positions)
+
+    def add(self, fp: bytes) -> None:
+        positions = self._positions(fp)
+        if self._has(self._current, positions):
+            return
+        if self.count >= self.capacity:
+            self._previous, self._current = self._current, bytearray(len(self._current))
+            self.count = 0
+        for p in positions:
+            self._current[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def seen(self, question: list) -> bool:
+        return fingerprint(question[0]) in self
+
+    def dump(self) -> tuple[bytes, bytes, int]:
+        return bytes(self._current), bytes(self._previous), self.count
@@ -0,0 +1,42 @@
+class SubjectCatalog:
+    """Process-wide cache of quiz subjects.
+
+    Loaded once at startup; add_subject and delete_subject update it and bump
+    `version`, so anything built from the list (keyboards) can be reused
+    until the version changes.
+    """
+
+    def __init__(self) -> None:
+        self.version = 0
+        self.subjects: tuple[str, ...] = ()
+        self._lookup: frozenset[str] = frozenset()
+
+    def __contains__(self, subject: str) -> bool:
+        return subject.strip().lower() in self._lookup
+
+    def __iter__(self):
+        return iter(self.subjects)
+
+    def __len__(self) -> int:
+        return len(self.subjects)
+
+    def replace(self, subjects) -> None:
+        subjects = tuple(subjects)
+        if subjects == self.subjects:
+            return
+        self.subjects = subjects
+        self._lookup = frozenset(self.subjects)
+        self.version += 1
+
+    def add(self, subject: str) -> None:
+        subject = subject.strip().lower()
+        if subject not in self._lookup:
+            self.replace(self.subjects + (subject,))
+
+    def remove(self, subject: str) -> None:
+        subject = subject.strip().lower()
+        if subject in self._lookup:
+            self.replace(s for s in self.subjects if s != subject)
+
+
+catalog = SubjectCatalog()
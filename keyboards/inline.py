@@ -2,13 +2,17 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 
 
+LEVELS = {
+    'level_easy': '🔰 Лёгкий',
+    'level_medium': '⚖️ Средний',
+    'level_hard': '🔥 Сложный'
+}
+
 levels_inline_markup = InlineKeyboardMarkup(
     inline_keyboard=[
         [
-            InlineKeyboardButton(text='🔰 Лёгкий', callback_data='level_easy'),
-            InlineKeyboardButton(
-                text='⚖️ Средний', callback_data='level_medium'),
-            InlineKeyboardButton(text='🔥 Сложный', callback_data='level_hard')
+            InlineKeyboardButton(text=text, callback_data=key)
+            for key, text in LEVELS.items()
         ]
     ]
 )
@@ -1,20 +1,25 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
-import database.db as db
+from database.subjects import catalog
 
 
-def get_subjects_markup() -> list:
-    subjects = db.get_subjects()
+_subjects_markup: tuple[int, ReplyKeyboardMarkup] | None = None
 
-    subjects_markup = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=subject[0].upper())] for subject in subjects
-        ],
-        resize_keyboard=True,
-        input_field_placeholder='📚 Выберите предмет:'
-    )
 
-    return subjects_markup
+def get_subjects_markup() -> ReplyKeyboardMarkup:
+    """Return the subjects keyboard, rebuilt only when the catalog version changes."""
+    global _subjects_markup
+    if _subjects_markup is None or _subjects_markup[0] != catalog.version:
+        markup = ReplyKeyboardMarkup(
+            keyboard=[
+                [KeyboardButton(text=subject.upper())] for subject in catalog
+            ],
+            resize_keyboard=True,
+            input_field_placeholder='📚 Выберите предмет:'
+        )
+        _subjects_markup = (catalog.version, markup)
+
+    return _subjects_markup[1]
 
 start_keyboard = ReplyKeyboardMarkup(keyboard=[
     [KeyboardButton(text='📚 Начать викторину'),
@@ -1,6 +1,9 @@
+import time
+
 from aiogram import BaseMiddleware, types
 
-from database import db
+from database import admin_counters
+from services import metrics
 
 # Определяем список админов прямо здесь (или импортируйте из config.py)
 ADMIN_IDS = {1708398974}  # замените на ваши ID
@@ -14,7 +17,7 @@ class AdminStatsMiddleware(BaseMiddleware):
         if message and message.from_user:
             user_id = message.from_user.id
             if is_admin(user_id):
-                db.increment_admin_stat(chat_id=user_id, stat_field="commands_used", increment=1)
+                admin_counters.increment(user_id, "commands_used")
         return await handler(event, data)
     
 class IsAdminMiddleware(BaseMiddleware):
@@ -27,3 +30,17 @@ class IsAdminMiddleware(BaseMiddleware):
                 return
         return await handler(event, data)
 
+
+class MetricsMiddleware(BaseMiddleware):
+    """Records how long every handler of the router runs and which exceptions it raises."""
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            metrics.handler_errors.inc(handler=name, exception=type(e).__name__)
+            raise
+        finally:
+            metrics.handler_duration.observe(time.perf_counter() - started, handler=name)
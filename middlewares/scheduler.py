@@ -0,0 +1,228 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageCaption, EditMessageReplyMarkup, EditMessageText, SendChatAction
+
+logger = logging.getLogger(__name__)
+
+HIGH = 0
+LOW = 1
+
+GLOBAL_RATE = float(os.getenv("OUTGOING_GLOBAL_RATE", "30"))
+CHAT_RATE = float(os.getenv("OUTGOING_CHAT_RATE", "1"))
+CHAT_BURST = float(os.getenv("OUTGOING_CHAT_BURST", "3"))
+
+EDIT_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+
+_priority = contextvars.ContextVar("outgoing_priority", default=HIGH)
+
+
+@contextlib.contextmanager
+def low_priority():
+    """Send every request made inside the block with low priority."""
+    token = _priority.set(LOW)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available."""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def penalize(self, seconds: float) -> None:
+        """Block the bucket for `seconds`, e.g. after Telegram's retry_after."""
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Request:
+    __slots__ = ("make_request", "bot", "method", "chat_id", "edit_key", "priority", "futures", "seq")
+
+    def __init__(self, make_request, bot, method, chat_id, edit_key, priority) -> None:
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.chat_id = chat_id
+        self.edit_key = edit_key
+        self.priority = priority
+        self.futures = []
+        self.seq = None
+
+
+class OutgoingScheduler(BaseRequestMiddleware):
+    """Rate-limited queue for every outgoing Bot API request bound to a chat.
+
+    Requests pass a global and a per-chat token bucket in priority order.
+    A pending edit of a message is replaced by a newer edit of the same
+    message, so only the latest text is sent. Requests without chat_id
+    (getUpdates, answerCallbackQuery, ...) go straight through.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 chat_burst: float = CHAT_BURST) -> None:
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._queue = []
+        self._edits: dict[tuple, _Request] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        edit_key = None
+        if isinstance(method, EDIT_METHODS) and method.message_id is not None:
+            edit_key = (chat_id, method.message_id)
+
+        priority = LOW if isinstance(method, SendChatAction) else _priority.get()
+        request = _Request(make_request, bot, method, chat_id, edit_key, priority)
+        future = asyncio.get_running_loop().create_future()
+        request.futures.append(future)
+        self._enqueue(request)
+
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return await future
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._worker
+
+    def _enqueue(self, request: _Request, requeue: bool = False) -> None:
+        """Queue a request; `requeue` marks one sent earlier that has to be retried."""
+        if request.edit_key is not None:
+            pending = self._edits.get(request.edit_key)
+            if pending is not None and pending is not request:
+                # Повтор старой правки не должен затереть более новый текст.
+                if not requeue:
+                    pending.method = request.method
+                pending.futures.extend(request.futures)
+                if request.priority < pending.priority:
+                    pending.priority = request.priority
+                    self._push(pending)
+                self._wakeup.set()
+                return
+            self._edits[request.edit_key] = request
+
+        self._push(request)
+        self._wakeup.set()
+
+    def _push(self, request: _Request) -> None:
+        # Only the newest heap entry of a request is live; older ones are skipped.
+        request.seq = next(self._counter)
+        heapq.heappush(self._queue, (request.priority, request.seq, request))
+
+    def _bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                now = time.monotonic()
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    async def _sleep(self, seconds: float) -> None:
+        self._wakeup.clear()
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            wait = self._global.delay(now)
+            if wait > 0:
+                await self._sleep(wait)
+                continue
+
+            chosen = None
+            deferred = []
+            min_wait = None
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                request = entry[2]
+                if entry[1] != request.seq:
+                    continue
+                chat_wait = self._bucket(request.chat_id).delay(now)
+                if chat_wait <= 0:
+                    chosen = request
+                    break
+                deferred.append(entry)
+                min_wait = chat_wait if min_wait is None else min(min_wait, chat_wait)
+            for entry in deferred:
+                heapq.heappush(self._queue, entry)
+
+            if chosen is None:
+                if min_wait is not None:
+                    await self._sleep(min_wait)
+                continue
+
+            self._global.take()
+            self._bucket(chosen.chat_id).take()
+            chosen.seq = None
+            if chosen.edit_key is not None and self._edits.get(chosen.edit_key) is chosen:
+                del self._edits[chosen.edit_key]
+            asyncio.create_task(self._perform(chosen))
+
+    async def _perform(self, request: _Request) -> None:
+        try:
+            result = await request.make_request(request.bot, request.method)
+        except TelegramRetryAfter as e:
+            logger.warning("Flood control for chat %s, retry in %s s", request.chat_id, e.retry_after)
+            self._bucket(request.chat_id).penalize(e.retry_after)
+            self._enqueue(request, requeue=True)
+            return
+        except asyncio.CancelledError:
+            for future in request.futures:
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in request.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future in request.futures:
+            if not future.done():
+                future.set_result(result)
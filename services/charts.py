@@ -0,0 +1,119 @@
+import asyncio
+import datetime
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_QUEUE_SIZE = int(os.getenv("CHART_QUEUE_SIZE", "16"))
+# Пауза перед прогревом пула, чтобы он не конкурировал с запуском опроса.
+CHART_WARMUP_DELAY = float(os.getenv("CHART_WARMUP_DELAY", "2"))
+
+_executor: ProcessPoolExecutor | None = None
+_pending = 0
+
+
+class ChartQueueFull(Exception):
+    """Очередь рендеринга переполнена, запрос нужно повторить позже."""
+
+
+def _init_worker() -> None:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+
+def _warm_up() -> None:
+    """Рисует пустой график, чтобы воркер прогрел кэш шрифтов и рендерер."""
+    _render_png({}, "")
+
+
+def _render_png(series: dict, title: str) -> bytes:
+    import matplotlib.pyplot as plt
+    from matplotlib import dates
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+
+    all_dates = []
+    for subject, (days, values) in series.items():
+        ax.plot(days, values, marker='o', label=subject)
+        all_dates += days
+
+    if all_dates:
+        ax.set_xlim(min(all_dates) - datetime.timedelta(days=1),
+                    max(all_dates) + datetime.timedelta(days=10))
+        ax.legend()
+        ax.xaxis.set_major_locator(dates.DayLocator())
+
+    ax.set_title(title)
+    ax.set_xlabel('Дата')
+    ax.set_ylabel('Результат')
+    ax.set_ylim(0, 10)
+    ax.grid(True, linestyle="--", alpha=0.7)
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def start() -> None:
+    """Создаёт пул процессов рендеринга; процессы запускаются при первой задаче или в warm_up()."""
+    global _executor
+    _executor = ProcessPoolExecutor(
+        max_workers=CHART_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+
+
+async def warm_up(delay: float = CHART_WARMUP_DELAY) -> None:
+    """Фоновая задача: через delay секунд после старта прогревает все воркеры.
+
+    Импорт matplotlib и кэш шрифтов стоят секунды процессорного времени, поэтому
+    прогрев не должен отнимать их у первых обновлений.
+    """
+    await asyncio.sleep(delay)
+    if _executor is None:
+        return
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(*(loop.run_in_executor(_executor, _warm_up) for _ in range(CHART_WORKERS)))
+    except Exception as e:
+        logger.error(f"Не удалось прогреть пул рендеринга графиков: {e}")
+        return
+    logger.info(f"Пул рендеринга графиков прогрет за {time.perf_counter() - started:.1f} с: {CHART_WORKERS} процесс(ов).")
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def render_stats(series: dict, title: str = 'Статистика по дням') -> io.BytesIO:
+    """Рисует график {предмет: (даты, значения)} в отдельном процессе и возвращает PNG.
+
+    Если в очереди уже CHART_QUEUE_SIZE графиков, сразу бросает ChartQueueFull.
+    """
+    global _pending
+    if _executor is None:
+        raise RuntimeError("Пул рендеринга графиков не запущен.")
+    if _pending >= CHART_QUEUE_SIZE:
+        raise ChartQueueFull()
+
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        png = await loop.run_in_executor(_executor, _render_png, series, title)
+    finally:
+        _pending -= 1
+    return io.BytesIO(png)
@@ -0,0 +1,280 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from typing import AsyncIterator, Callable
+
+import aiohttp
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+# Модели по порядку предпочтения; запасные берутся, когда основная медленная или сломана.
+OPENROUTER_MODELS = [
+    model.strip()
+    for model in os.getenv("OPENROUTER_MODELS", "mistralai/mixtral-8x7b-instruct").split(",")
+    if model.strip()
+]
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "6"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Если за столько секунд не пришёл первый вопрос, параллельно запрашиваем другую модель.
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "4"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Сколько закрытый поток ждёт конца ответа победителя: расход токенов приходит последним чанком.
+LLM_USAGE_GRACE = float(os.getenv("LLM_USAGE_GRACE", "1"))
+
+
+class UpstreamError(Exception):
+    """The model API answered with a non-200 status."""
+
+    def __init__(self, status: int, text: str) -> None:
+        super().__init__(f"HTTP {status}: {text[:150]}")
+        self.status = status
+
+
+class CircuitBreaker:
+    """Stops sending requests to a model after `threshold` failures in a row.
+
+    After `cooldown` seconds one trial request is let through (half-open);
+    its success closes the breaker, its failure opens it for another cooldown.
+    """
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._trial or time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        self._trial = True
+        return True
+
+    def release(self) -> None:
+        """Give up a trial request without a verdict, e.g. when it was cancelled."""
+        self._trial = False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self._trial or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+
+def backoff_delay(attempt: int, base: float = LLM_BACKOFF_BASE, cap: float = LLM_BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter for retry number `attempt` (from 0)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class GenerationClient:
+    """Streams items from a chat-completions API across several models.
+
+    Each attempt asks the best model whose breaker is closed. If it has not
+    produced a valid item after `hedge_delay` seconds, the next model is asked
+    too (the same one again if it is the only model); whichever produces a
+    valid item first wins and the other request is cancelled. Failed attempts
+    are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        url: str = OPENROUTER_URL,
+        models: list[str] = OPENROUTER_MODELS,
+        max_attempts: int = LLM_MAX_ATTEMPTS,
+        hedge_delay: float = LLM_HEDGE_DELAY,
+        usage_grace: float = LLM_USAGE_GRACE,
+    ) -> None:
+        self.url = url
+        self.models = list(models)
+        self.max_attempts = max_attempts
+        self.hedge_delay = hedge_delay
+        self.usage_grace = usage_grace
+        self.breakers = {model: CircuitBreaker() for model in self.models}
+        self._request_ids = itertools.count()
+
+    def _pick(self, exclude: set[str]) -> str | None:
+        for model in self.models:
+            if model not in exclude and self.breakers[model].allow():
+                return model
+        return None
+
+    def _record(self, model: str, ok: bool) -> None:
+        breaker = self.breakers[model]
+        was_open = breaker.is_open
+        if ok:
+            breaker.success()
+        else:
+            breaker.failure()
+        if breaker.is_open != was_open:
+            logger.warning(f"Circuit breaker модели {model} {'открыт' if breaker.is_open else 'закрыт'}.")
+        metrics.llm_circuit_open.set(int(breaker.is_open), model=model)
+
+    async def _request(
+        self, request_id: int, model: str, session: aiohttp.ClientSession, headers: dict, payload: dict,
+        parser_factory: Callable, queue: asyncio.Queue, usage: dict,
+    ) -> None:
+        """Stream one answer into `queue` as ("item", id, item) messages and a final ("end", id, error)."""
+        error = None
+        payload = {**payload, "model": model, "stream": True, "usage": {"include": True}}
+        try:
+            async with session.post(self.url, headers=headers, json=payload) as response:
+                metrics.llm_responses.inc(status=str(response.status), model=model)
+                if response.status != 200:
+                    raise UpstreamError(response.status, await response.text())
+
+                parser = parser_factory()
+                async for line in response.content:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except json.JSONDecodeError:
+                        metrics.llm_parse_failures.inc(reason="stream")
+                        continue
+                    # OpenRouter присылает расход токенов последним чанком ответа.
+                    for kind in ("prompt_tokens", "completion_tokens"):
+                        tokens = (chunk.get("usage") or {}).get(kind)
+                        if tokens:
+                            metrics.llm_tokens.inc(tokens, model=model, kind=kind)
+                            usage[kind] = usage.get(kind, 0) + tokens
+                    delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content") or ""
+                    for item in parser.feed(delta):
+                        queue.put_nowait(("item", request_id, item))
+        except aiohttp.ClientError as e:
+            metrics.llm_responses.inc(status="network", model=model)
+            error = e
+        except UpstreamError as e:
+            error = e
+        except Exception as e:
+            logger.error(f"Ошибка запроса к {model}: {e}", exc_info=True)
+            error = e
+        finally:
+            queue.put_nowait(("end", request_id, error))
+
+    async def stream(
+        self, session: aiohttp.ClientSession, headers: dict, make_payload: Callable[[], dict],
+        parser_factory: Callable, usage: dict | None = None,
+    ) -> AsyncIterator:
+        """Yield items until the caller stops iterating or the attempts run out.
+
+        `make_payload()` is called before every attempt, so a retry can ask
+        only for what the caller still misses. `parser_factory()` must return
+        an object whose feed(text) returns the items completed by that piece
+        of the answer. Tokens reported by the API are added to `usage`.
+        Closing the generator gives the winning request up to `usage_grace`
+        seconds to finish and report its usage, then cuts it off; only a
+        close, not a cancellation, counts as a success of the winning model.
+        """
+        usage = {} if usage is None else usage
+        attempts = 0
+        cancelled = False
+        running: dict[int, tuple[str, asyncio.Task]] = {}
+        winner = None
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def launch(model: str) -> None:
+            request_id = next(self._request_ids)
+            task = asyncio.create_task(
+                self._request(request_id, model, session, headers, payload, parser_factory, queue, usage))
+            running[request_id] = (model, task)
+
+        def cancel(request_id: int) -> None:
+            model, task = running.pop(request_id)
+            task.cancel()
+            # Отменённый запрос ничего не говорит о здоровье модели.
+            self.breakers[model].release()
+
+        try:
+            for attempt in range(self.max_attempts):
+                primary = self._pick(set())
+                if primary is None:
+                    logger.error("Все модели недоступны: circuit breaker открыт.")
+                    return
+                attempts += 1
+                queue = asyncio.Queue()
+                payload = make_payload()
+                winner = None
+                produced = 0
+                launch(primary)
+                hedge_at = time.monotonic() + self.hedge_delay
+
+                while running:
+                    timeout = max(hedge_at - time.monotonic(), 0) if winner is None and hedge_at else None
+                    try:
+                        kind, request_id, value = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        hedge_at = None
+                        backup = self._pick({primary}) or (primary if len(self.models) == 1 else None)
+                        if backup is not None:
+                            metrics.llm_hedged_requests.inc(model=backup)
+                            logger.info(f"Модель {primary} молчит {self.hedge_delay:.1f} с, параллельно спрашиваем {backup}.")
+                            launch(backup)
+                        continue
+
+                    if request_id not in running:
+                        continue
+                    if kind == "item":
+                        if winner is None:
+                            winner = request_id
+                            for other in [other for other in running if other != winner]:
+                                cancel(other)
+                        produced += 1
+                        yield value
+                    else:
+                        model, _ = running.pop(request_id)
+                        if value is not None:
+                            logger.warning(f"[{attempt + 1}/{self.max_attempts}] {model}: {value}")
+                        # Ответ без единого годного элемента — такой же отказ, как ошибка HTTP.
+                        self._record(model, ok=value is None and request_id == winner)
+                        if request_id == winner:
+                            break
+
+                if produced:
+                    logger.warning(f"Ответ закончился на {produced} элементах, продолжаем генерацию.")
+                elif attempt + 1 < self.max_attempts:
+                    await asyncio.sleep(backoff_delay(attempt))
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            winning = running.pop(winner, None) if not cancelled else None
+            for request_id in list(running):
+                cancel(request_id)
+            metrics.llm_attempts.observe(attempts)
+            if winning is not None:
+                # Потребитель сам закрыл поток: от этой модели он получил всё, что хотел.
+                model, task = winning
+                self._record(model, ok=True)
+                # Хвост ответа дочитываем ради чанка с расходом токенов, но не дольше
+                # usage_grace: дальше модель генерирует то, за что платить незачем.
+                try:
+                    await asyncio.wait({task}, timeout=self.usage_grace)
+                finally:
+                    task.cancel()
+
+
+client = GenerationClient()
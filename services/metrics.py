@@ -0,0 +1,219 @@
+"""Метрики процесса в текстовом формате Prometheus.
+
+Без зависимостей: счётчики, гистограммы и gauge с метками, общий реестр и
+HTTP-эндпоинт /metrics. Метрики пишутся и из потока базы, поэтому каждая
+защищена своей блокировкой.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# 0 отключает эндпоинт; шард-воркер с номером i слушает METRICS_PORT + i.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry: list["_Metric"] = []
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Счётчики по корзинам (последняя — +Inf), сумма, количество.
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_sample(self, key: tuple, value) -> list[str]:
+        counts, total, count = value[0][:], value[1], value[2]
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- метрики бота ---
+
+handler_duration = Histogram(
+    "bot_handler_duration_seconds", "Time spent in an update handler.", ("handler",))
+handler_errors = Counter(
+    "bot_handler_errors_total", "Exceptions raised by update handlers.", ("handler", "exception"))
+
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "SQLite statement time on the database thread, by statement type.",
+    ("statement",))
+db_job_duration = Histogram(
+    "db_job_duration_seconds", "Time of a run_db job on the database thread.", ("job",))
+db_queue_wait = Histogram(
+    "db_queue_wait_seconds", "Time a database job waited for the database thread.")
+
+llm_generation_duration = Histogram(
+    "llm_generation_duration_seconds", "Time to generate a whole quiz, by outcome.", ("outcome",))
+llm_first_question = Histogram(
+    "llm_first_question_seconds", "Time until the first streamed question was parsed.")
+llm_attempts = Histogram(
+    "llm_generation_attempts", "HTTP attempts one quiz generation needed.", buckets=(1, 2, 3, 5, 10))
+llm_responses = Counter(
+    "llm_http_responses_total", "Responses of the model API by HTTP status, or 'network' on client errors.",
+    ("status", "model"))
+llm_hedged_requests = Counter(
+    "llm_hedged_requests_total", "Backup requests started because the first model was too slow.", ("model",))
+llm_circuit_open = Gauge(
+    "llm_circuit_open", "1 while the circuit breaker of a model is open.", ("model",))
+llm_parse_failures = Counter(
+    "llm_parse_failures_total",
+    "Streamed questions dropped as invalid: unparseable, wrong format, or answer not among the options.",
+    ("reason",))
+llm_dropped_questions = Counter(
+    "llm_dropped_questions_total",
+    "Valid streamed questions dropped: a duplicate within the quiz, or already seen by the user.",
+    ("reason",))
+llm_parsed_questions = Counter(
+    "llm_parsed_questions_total", "Streamed questions that parsed and passed validation.")
+llm_tokens = Counter(
+    "llm_tokens_total", "Tokens the model API reported as spent, by model and prompt/completion.",
+    ("model", "kind"))
+llm_quiz_tokens = Histogram(
+    "llm_quiz_tokens", "Tokens spent on one quiz generation, by outcome.", ("outcome",),
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000))
+
+event_loop_lag = Gauge(
+    "event_loop_lag_seconds", "How late the last event loop lag probe woke up.")
+
+
+async def loop_lag_monitor(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """Measure how late asyncio.sleep wakes up; a blocked loop shows up here first."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag.set(max(loop.time() - started - interval, 0.0))
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> web.AppRunner | None:
+    """Serve /metrics on host:port; returns None when the port is 0 or taken."""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.error("Metrics endpoint on %s:%d is unavailable: %s", host, port, e)
+        await runner.cleanup()
+        return None
+    logger.info("Metrics on http://%s:%d/metrics", host, port)
+    return runner
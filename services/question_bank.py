@@ -0,0 +1,78 @@
+import asyncio
+import collections
+import logging
+import os
+import time
+
+import aiohttp
+
+import database.db as db
+from database.seen import SeenFilter
+from database.subjects import catalog
+from keyboards.inline import LEVELS
+from services.utils import QUIZ_SIZE, generate_quiz
+
+logger = logging.getLogger(__name__)
+
+LOW_WATER = int(os.getenv("QUESTION_BANK_LOW_WATER", "30"))
+REFILL_INTERVAL = float(os.getenv("QUESTION_BANK_REFILL_INTERVAL", "60"))
+
+hits = 0
+misses = 0
+refill_latencies = collections.deque(maxlen=50)
+
+
+async def draw_quiz(subject: str, level: str, seen_filter: SeenFilter | None = None) -> list | None:
+    """Берёт готовый квиз из банка вопросов или возвращает None, если непросмотренных вопросов мало."""
+    global hits, misses
+    quiz = await db.take_bank_questions(subject, level, QUIZ_SIZE, seen_filter)
+    if quiz is None:
+        misses += 1
+        return None
+    hits += 1
+    return quiz
+
+
+async def refill_once(session: aiohttp.ClientSession) -> None:
+    """Дополняет каждый пул (предмет, уровень) до нижней границы LOW_WATER."""
+    depth = {(subject, level): count for subject, level, count in await db.get_question_bank_depth() or []}
+
+    for subject in catalog:
+        for level in LEVELS.values():
+            count = depth.get((subject, level), 0)
+            while count < LOW_WATER:
+                started = time.perf_counter()
+                quiz = await generate_quiz(subject, level, session)
+                if not quiz:
+                    logger.warning(f"Не удалось пополнить банк вопросов: {subject} / {level}")
+                    break
+                await db.add_bank_questions(subject, level, quiz)
+                refill_latencies.append(time.perf_counter() - started)
+                count += len(quiz)
+
+
+async def refill_worker(session: aiohttp.ClientSession) -> None:
+    """Фоновая задача, которая периодически пополняет банк вопросов."""
+    while True:
+        try:
+            await refill_once(session)
+        except Exception as e:
+            logger.error(f"Ошибка пополнения банка вопросов: {e}", exc_info=True)
+        await asyncio.sleep(REFILL_INTERVAL)
+
+
+async def describe() -> str:
+    """Текстовая сводка по банку вопросов для админ-статистики."""
+    depth = await db.get_question_bank_depth() or []
+    total = hits + misses
+    hit_rate = f"{hits / total:.0%}" if total else "—"
+    latency = f"{sum(refill_latencies) / len(refill_latencies):.1f} с" if refill_latencies else "—"
+
+    lines = [
+        "🗃 <b>Банк вопросов</b>",
+        f"Попадания: {hits}/{total} ({hit_rate})",
+        f"Среднее время пополнения: {latency}",
+        "",
+    ]
+    lines += [f"{subject} / {level}: {count}" for subject, level, count in sorted(depth)]
+    return "\n".join(lines)
@@ -0,0 +1,98 @@
+import asyncio
+import contextlib
+import logging
+
+import aiohttp
+
+import database.db as db
+from database.seen import SeenFilter, fingerprint
+
+from services.utils import QUIZ_SIZE, stream_quiz
+
+logger = logging.getLogger(__name__)
+
+_streams: dict[int, "QuizStream"] = {}
+
+
+class QuizStream:
+    """Викторина, вопросы которой ещё догенерируются в фоне."""
+
+    def __init__(self) -> None:
+        self.questions = []
+        self.done = False
+        self._changed = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+
+    async def get(self, index: int) -> list | None:
+        """Ждёт вопрос с номером index; None, если генерация закончилась раньше."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: index < len(self.questions) or self.done)
+        return self.questions[index] if index < len(self.questions) else None
+
+    async def wait_done(self) -> list:
+        """Ждёт окончания генерации и возвращает все полученные вопросы."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.done)
+        return self.questions
+
+    async def _fill(self, subject: str, level: str, session: aiohttp.ClientSession,
+                    seen_filter: SeenFilter | None) -> None:
+        try:
+            skip = seen_filter.seen if seen_filter is not None else None
+            # aclosing: при отмене запрос к модели обрывается сразу, а не при сборке мусора.
+            async with contextlib.aclosing(stream_quiz(subject, level, session, skip)) as questions:
+                async for question in questions:
+                    async with self._changed:
+                        self.questions.append(question)
+                        self._changed.notify_all()
+                    if len(self.questions) == QUIZ_SIZE:
+                        break
+            if len(self.questions) < QUIZ_SIZE:
+                await self._top_up(subject, level, seen_filter)
+        except Exception as e:
+            logger.error(f"Ошибка потоковой генерации: {e}", exc_info=True)
+        finally:
+            self.done = True
+            async with self._changed:
+                self._changed.notify_all()
+
+
+    async def _top_up(self, subject: str, level: str, seen_filter: SeenFilter | None) -> None:
+        """Добирает недостающие вопросы из банка, если генерация закончилась раньше времени."""
+        missing = QUIZ_SIZE - len(self.questions)
+        # Вопросы этой же викторины тоже считаем виденными, чтобы банк их не повторил.
+        seen_filter = SeenFilter(*seen_filter.dump()) if seen_filter is not None else SeenFilter()
+        for question in self.questions:
+            seen_filter.add(fingerprint(question[0]))
+        extra = await db.take_bank_questions(subject, level, missing, seen_filter)
+        if not extra:
+            logger.warning(f"Викторина осталась неполной: {len(self.questions)} из {QUIZ_SIZE} вопросов.")
+            return
+        logger.info(f"Генерация дала {len(self.questions)} из {QUIZ_SIZE} вопросов, {missing} взяты из банка.")
+        async with self._changed:
+            self.questions.extend(extra)
+            self._changed.notify_all()
+
+
+def start(chat_id: int, subject: str, level: str, session: aiohttp.ClientSession,
+          seen_filter: SeenFilter | None = None) -> QuizStream:
+    """Запускает фоновую генерацию викторины для чата, пропуская уже виденные вопросы."""
+    discard(chat_id)
+    stream = QuizStream()
+    stream._task = asyncio.create_task(stream._fill(subject, level, session, seen_filter))
+    _streams[chat_id] = stream
+    return stream
+
+
+def get(chat_id: int) -> QuizStream | None:
+    return _streams.get(chat_id)
+
+
+def discard(chat_id: int, stream: QuizStream | None = None) -> None:
+    """Останавливает и забывает генерацию чата (только указанную, если передана)."""
+    current = _streams.get(chat_id)
+    if current is None or (stream is not None and current is not stream):
+        return
+    del _streams[chat_id]
+    if current._task and not current._task.done():
+        current._task.cancel()
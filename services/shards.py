@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+import database.db as db
+
+logger = logging.getLogger(__name__)
+
+SHARD_MAX_CONCURRENCY = int(os.getenv("SHARD_MAX_CONCURRENCY", "100"))
+SHARD_DRAIN_TIMEOUT = float(os.getenv("SHARD_DRAIN_TIMEOUT", "30"))
+SHARD_START_TIMEOUT = float(os.getenv("SHARD_START_TIMEOUT", "60"))
+# Как часто воркер перечитывает кэши, которые меняют другие процессы.
+SHARD_REFRESH_INTERVAL = float(os.getenv("SHARD_REFRESH_INTERVAL", "60"))
+
+
+def chat_key(update: Update) -> int:
+    """The id updates are sharded and ordered by: the chat, else the user, else 0."""
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat is not None:
+        return context.chat.id
+    if context.user is not None:
+        return context.user.id
+    return 0
+
+
+def shard_of(chat_id: int, shards: int) -> int:
+    return hash(chat_id) % shards
+
+
+def start_workers(target: Callable, count: int) -> tuple[list[multiprocessing.Process], list[int]]:
+    """Spawn `count` processes running target(index, count, ready) and wait for their ports.
+
+    Each worker must put (index, port) into `ready` once it listens.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Queue()
+    # Не daemon: у воркера свой пул процессов для графиков.
+    processes = [ctx.Process(target=target, args=(index, count, ready)) for index in range(count)]
+    for process in processes:
+        process.start()
+
+    ports = [0] * count
+    try:
+        for _ in range(count):
+            index, port = ready.get(timeout=SHARD_START_TIMEOUT)
+            ports[index] = port
+    except BaseException:
+        for process in processes:
+            process.terminate()
+        raise
+    return processes, ports
+
+
+def stop_workers(processes: list[multiprocessing.Process], timeout: float = SHARD_DRAIN_TIMEOUT) -> None:
+    """Wait for workers that were told to stop (their input stream closed), then kill stragglers."""
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            logger.warning("Shard worker %s did not stop in time, terminating", process.pid)
+            process.terminate()
+            process.join()
+
+
+class ShardRouter(BaseMiddleware):
+    """Outer update middleware of the front process: sends every update to its shard.
+
+    Updates travel as JSON lines over one local TCP stream per worker, so a
+    worker sees the updates of a chat in the order Telegram delivered them.
+    """
+
+    def __init__(self, ports: list[int]) -> None:
+        self._ports = ports
+        self._writers: list[asyncio.StreamWriter] = []
+
+    async def connect(self) -> None:
+        for port in self._ports:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            self._writers.append(writer)
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        writer = self._writers[shard_of(chat_key(event), len(self._writers))]
+        # write() до первого await: порядок записи в поток совпадает с порядком обновлений.
+        writer.write(event.model_dump_json(exclude_unset=True).encode() + b"\n")
+        await writer.drain()
+        return True
+
+    async def close(self) -> None:
+        for writer in self._writers:
+            writer.close()
+        await asyncio.gather(*(writer.wait_closed() for writer in self._writers), return_exceptions=True)
+        self._writers.clear()
+
+
+class ChatSerializer:
+    """Runs updates concurrently across chats but strictly in order within a chat."""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int) -> None:
+        self._dispatcher = dispatcher
+        self._bot = bot
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tails: dict[int, asyncio.Task] = {}
+
+    async def submit(self, update: Update) -> None:
+        # Ждём свободный слот до чтения следующей строки — это и есть обратное давление на фронт.
+        await self._semaphore.acquire()
+        key = chat_key(update)
+        task = asyncio.create_task(self._process(self._tails.get(key), update))
+        self._tails[key] = task
+        task.add_done_callback(lambda t: self._tails.pop(key, None) if self._tails.get(key) is t else None)
+
+    async def _process(self, previous: asyncio.Task | None, update: Update) -> None:
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await self._dispatcher.feed_update(self._bot, update)
+        except Exception:
+            logger.exception("Failed to process update %s", update.update_id)
+        finally:
+            self._semaphore.release()
+
+    async def drain(self, timeout: float) -> None:
+        tasks = set(self._tails.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning("Cancelling %d chats still busy after %.0f s", len(pending), timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def serve_shard(dispatcher: Dispatcher, bot: Bot, index: int, ready) -> None:
+    """Take updates from the front process until it closes the stream, then drain and shut down."""
+    serializer = ChatSerializer(dispatcher, bot, SHARD_MAX_CONCURRENCY)
+    finished = asyncio.Event()
+
+    async def consume(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    update = Update.model_validate_json(line, context={"bot": bot})
+                except ValueError as e:
+                    logger.error("Shard %d got a malformed update: %s", index, e)
+                    continue
+                await serializer.submit(update)
+        finally:
+            writer.close()
+            finished.set()
+
+    server = await asyncio.start_server(consume, "127.0.0.1", 0)
+    workflow_data = {"dispatcher": dispatcher, "bots": [bot], **dispatcher.workflow_data}
+    await dispatcher.emit_startup(bot=bot, **workflow_data)
+    try:
+        ready.put((index, server.sockets[0].getsockname()[1]))
+        await finished.wait()
+    finally:
+        server.close()
+        await serializer.drain(SHARD_DRAIN_TIMEOUT)
+        await dispatcher.emit_shutdown(bot=bot, **workflow_data)
+
+
+async def refresh_worker() -> None:
+    """Periodically reload caches that other shard processes change in the shared database."""
+    while True:
+        await asyncio.sleep(SHARD_REFRESH_INTERVAL)
+        try:
+            await db.load_caches()
+        except Exception as e:
+            logger.error("Shard cache refresh failed: %s", e)
@@ -1,115 +1,276 @@
 import aiohttp
 import json
-import ast
 import asyncio
+import contextlib
 from aiogram import types
+from middlewares.scheduler import low_priority
+from services import llm, metrics
 from dotenv import load_dotenv
 import os
 import logging
+import time
+from typing import Callable
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
 
-async def generate_quiz(subject: str, level: str) -> list | None:
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Создаёт общий HTTP-клиент приложения с пулом keep-alive соединений."""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=60,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=None,
+        connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+QUIZ_SIZE = 10
+
+
+async def generate_quiz(subject: str, level: str, session: aiohttp.ClientSession) -> list | None:
     """Асинхронная генерация викторины через OpenRouter API."""
-    API_KEY = os.getenv("OPENROUTER_API_KEY")
-    if not API_KEY:
-        raise ValueError("OPENROUTER_API_KEY не установлен в переменные окружения.")
+    quiz = [question async for question in stream_quiz(subject, level, session)]
+    return quiz if len(quiz) == QUIZ_SIZE else None
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-    }
 
-    payload = {
-        "model": "mistralai/mixtral-8x7b-instruct",
+# Короткие ключи экономят выходные токены: q — вопрос, o — варианты A–D по
+# порядку, a — буква правильного варианта, e — объяснение.
+QUIZ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "q": {"type": "string"},
+                    "o": {"type": "array", "items": {"type": "string"}},
+                    "a": {"type": "string", "enum": ["A", "B", "C", "D"]},
+                    "e": {"type": "string"},
+                },
+                "required": ["q", "o", "a", "e"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["items"],
+    "additionalProperties": False,
+}
+
+
+def quiz_payload(subject: str, level: str, count: int, exclude: list[str] = ()) -> dict:
+    """Запрос на count вопросов; exclude — уже полученные вопросы, которые нельзя повторять."""
+    avoid = ""
+    if exclude:
+        avoid = "\nНе повторяй эти вопросы:\n" + "\n".join(f"- {question}" for question in exclude) + "\n"
+    return {
         "messages": [
             {
                 "role": "user",
                 "content": f"""
-Сгенерируй 10 экзаменационных вопросов для подготовки к ОГЭ по предмету "{subject}" уровня сложности "{level}".
-
-Каждый вопрос — список из 4 элементов:
-[
-"Вопрос",
-{{
-    "A": "...",
-    "B": "...",
-    "C": "...",
-    "D": "..."
-}},
-"Правильный вариант (A|B|C|D)",
-"Подробное объяснение"
-]
-
-Ответ: только **валидный Python-список из 10 таких списков**. Без заголовков, markdown и комментариев.
+Сгенерируй {count} экзаменационных вопросов для подготовки к ОГЭ по предмету "{subject}" уровня сложности "{level}".
+
+Ответ — JSON {{"items": [...]}}, каждый вопрос — объект:
+{{"q": "вопрос", "o": ["вариант A", "вариант B", "вариант C", "вариант D"], "a": "буква правильного варианта", "e": "краткое объяснение"}}
+{avoid}
+Только JSON, без markdown и комментариев.
 """
             }
-        ]
+        ],
+        # Модели без structured outputs игнорируют поле, тогда выручает терпимый парсер.
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "quiz", "strict": True, "schema": QUIZ_SCHEMA},
+        },
+    }
+
+
+async def stream_quiz(subject: str, level: str, session: aiohttp.ClientSession,
+                      skip: Callable[[list], bool] | None = None):
+    """Потоково генерирует викторину и отдаёт каждый вопрос, как только он готов.
+
+    Годные вопросы из неполного или частично битого ответа сохраняются, а
+    повторный запрос просит у модели только недостающие. Вопросы, для которых
+    skip(question) истинно, пропускаются и тоже догенерируются.
+    """
+    API_KEY = os.getenv("OPENROUTER_API_KEY")
+    if not API_KEY:
+        raise ValueError("OPENROUTER_API_KEY не установлен в переменные окружения.")
+
+    headers = {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json",
     }
 
-    for attempt in range(10):
-        try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session, session.post(url, headers=headers, json=payload) as response:
-                if response.status != 200:
-                    text = await response.text()
-                    logger.warning(f"[{attempt+1}/10] API {response.status}: {text[:150]}")
+    started = time.perf_counter()
+    seen = {}
+    skipped = []
+    usage = {}
+    outcome = "cancelled"
+
+    def payload() -> dict:
+        if seen:
+            logger.info(f"Догенерация: нужно ещё {QUIZ_SIZE - len(seen)} из {QUIZ_SIZE} вопросов.")
+        return quiz_payload(subject, level, QUIZ_SIZE - len(seen), list(seen.values()) + skipped[-QUIZ_SIZE:])
+
+    try:
+        # Модель, повторы, хеджирование и circuit breaker — забота llm.client.
+        async with contextlib.aclosing(llm.client.stream(session, headers, payload, QuizItemParser, usage)) as questions:
+            async for question in questions:
+                key = question[0].strip().lower()
+                if key in seen:
+                    metrics.llm_dropped_questions.inc(reason="duplicate")
                     continue
+                if skip is not None and skip(question):
+                    metrics.llm_dropped_questions.inc(reason="seen")
+                    skipped.append(question[0].strip())
+                    continue
+                seen[key] = question[0].strip()
+                if len(seen) == 1:
+                    metrics.llm_first_question.observe(time.perf_counter() - started)
+                    logger.info(f"Первый вопрос получен за {time.perf_counter() - started:.2f} с.")
+                if len(seen) == QUIZ_SIZE:
+                    # Потребитель обычно закрывает генерацию сразу на последнем вопросе.
+                    outcome = "ok"
+                    logger.info(f"✅ Квиз успешно сгенерирован за {time.perf_counter() - started:.2f} с.")
+                yield question
+                if outcome == "ok":
+                    return
+
+        outcome = "failed"
+        logger.error(f"❌ Не удалось получить {QUIZ_SIZE} вопросов от ИИ: получено {len(seen)} за {time.perf_counter() - started:.2f} с.")
+    finally:
+        # "cancelled" — потребитель бросил генерацию раньше, чем она закончилась.
+        metrics.llm_generation_duration.observe(time.perf_counter() - started, outcome=outcome)
+        if usage:
+            metrics.llm_quiz_tokens.observe(sum(usage.values()), outcome=outcome)
+
+
+class QuizItemParser:
+    """Инкрементальный парсер ответа модели.
+
+    Пропускает всё до первого массива объектов или списков — markdown-ограду,
+    пояснения, обёртку {"items": — и возвращает каждый его элемент, как только
+    закрылась его скобка. Скобки в пояснениях вроде «вот [10] вопросов»
+    пропускаются. Текст после массива игнорируется.
+    """
+
+    def __init__(self) -> None:
+        self._depth = 0
+        self._items_depth = None
+        self._has_items = False
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
 
-                result = await response.json()
-                content = result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-
-            if not content:
-                logger.warning(f"[{attempt+1}/10] Пустой ответ от API.")
-                continue
-
-            try:
-                # Сначала пробуем JSON
-                quiz_list = json.loads(content)
-            except Exception:
-                try:
-                    quiz_list = ast.literal_eval(content)
-                except Exception as parse_err:
-                    logger.warning(f"[{attempt+1}/10] Ошибка парсинга ответа: {parse_err}")
+    def feed(self, text: str) -> list:
+        """Принимает очередной фрагмент текста и возвращает готовые вопросы."""
+        questions = []
+        for ch in text:
+            if self._done:
+                break
+            if self._items_depth is not None and self._depth > self._items_depth:
+                self._buffer.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"' and self._depth >= 1:
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+                if self._items_depth is None and ch == "[":
+                    self._items_depth = self._depth
+                    self._has_items = False
+                elif self._items_depth is not None and self._depth == self._items_depth + 1:
+                    self._has_items = True
+                    self._buffer = [ch]
+            elif ch in "]}" and self._depth > 0:
+                self._depth -= 1
+                if self._items_depth is None:
                     continue
+                if self._depth == self._items_depth:
+                    question = parse_question("".join(self._buffer))
+                    if question is not None:
+                        questions.append(question)
+                elif self._depth < self._items_depth:
+                    if self._has_items:
+                        self._done = True
+                    else:
+                        # Это была скобка в тексте, а не массив вопросов: ищем дальше.
+                        self._items_depth = None
+        return questions
+
+
+def parse_question(text: str) -> list | None:
+    """Разбирает один вопрос и проверяет его формат.
+
+    Принимает компактный объект {"q", "o", "a", "e"} и прежний список
+    [вопрос, {буква: вариант}, буква, объяснение]; возвращает список.
+    """
+    try:
+        question = json.loads(text)
+    except ValueError as parse_err:
+        metrics.llm_parse_failures.inc(reason="syntax")
+        logger.warning(f"Ошибка парсинга вопроса: {parse_err}")
+        return None
+
+    if isinstance(question, dict) and isinstance(question.get("o"), list):
+        question = [
+            question.get("q"),
+            {chr(ord("A") + i): option for i, option in enumerate(question["o"])},
+            question.get("a"),
+            question.get("e"),
+        ]
 
-            if (
-                isinstance(quiz_list, list)
-                and len(quiz_list) == 10
-                and all(
-                    isinstance(q, list)
-                    and len(q) == 4
-                    and isinstance(q[0], str)
-                    and isinstance(q[1], dict)
-                    and isinstance(q[2], str)
-                    and isinstance(q[3], str)
-                    for q in quiz_list
-                )
-            ):
-                logger.info(f"✅ Квиз успешно сгенерирован на {attempt+1}-й попытке.")
-                return quiz_list
-            else:
-                logger.warning(f"[{attempt+1}/10] Ответ не соответствует ожидаемому формату.")
-                continue
-
-        except aiohttp.ClientError as e:
-            logger.error(f"[{attempt+1}/10] Ошибка сети: {e}")
-            await asyncio.sleep(1)
-            continue
-        except Exception as e:
-            logger.error(f"[{attempt+1}/10] Неизвестная ошибка: {e}", exc_info=True)
-            await asyncio.sleep(1)
-            continue
-
-    logger.error("❌ Не удалось получить валидный список от ИИ после 10 попыток.")
-    return None
-
-
-def answer_isright(answer_num: int, answer: str, quiz: list) -> bool:
+    if not (
+        isinstance(question, list)
+        and len(question) == 4
+        and isinstance(question[0], str)
+        and question[0].strip()
+        and isinstance(question[1], dict)
+        and 2 <= len(question[1]) <= 26
+        and all(isinstance(key, str) and isinstance(option, str) for key, option in question[1].items())
+        and isinstance(question[2], str)
+        and isinstance(question[3], str)
+    ):
+        metrics.llm_parse_failures.inc(reason="format")
+        logger.warning("Вопрос не соответствует ожидаемому формату.")
+        return None
+
+    options = {key.strip().upper(): key for key in question[1]}
+    answer = options.get(question[2].strip().upper())
+    if answer is None:
+        metrics.llm_parse_failures.inc(reason="answer")
+        logger.warning(f"Ответ {question[2]!r} не входит в варианты {list(question[1])}.")
+        return None
+    # Ответ приводим к ключу варианта: answer_isright сравнивает их как строки.
+    question[2] = answer
+    metrics.llm_parsed_questions.inc()
+    return question
+
+
+def answer_isright(question: list, answer: str) -> bool:
     """Проверяет правильность ответа пользователя."""
-    return quiz[answer_num][2].strip().lower() == answer.strip().lower()
+    return question[2].strip().lower() == answer.strip().lower()
 
 
 async def show_loading_animation(message: types.Message, task: asyncio.Task) -> any:
@@ -120,12 +281,19 @@ async def show_loading_animation(message: types.Message, task: asyncio.Task) ->
 
     msg = await message.answer(f"<b>{loading_text}{dots[i]}</b>", parse_mode="HTML")
 
+    # Правки анимации не ждём: планировщик отправит только последнюю из них
+    # и не даст им вытеснить вопросы и ответы.
     while not task.done():
         i = (i + 1) % len(dots)
-        try:
-            await msg.edit_text(f"<b>{loading_text}{dots[i]}</b>", parse_mode="HTML")
-        except Exception:
-            pass
+        with low_priority():
+            # edit_text возвращает метод Bot API, а не корутину — create_task его не примет.
+            edit = asyncio.ensure_future(msg.edit_text(f"<b>{loading_text}{dots[i]}</b>", parse_mode="HTML"))
+        edit.add_done_callback(_log_failed_edit)
         await asyncio.sleep(0.3)
 
     return await task
+
+
+def _log_failed_edit(edit: asyncio.Task) -> None:
+    if not edit.cancelled() and edit.exception():
+        logger.debug(f"Не удалось обновить анимацию загрузки: {edit.exception()}")
@@ -0,0 +1,145 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+from contextlib import suppress
+from urllib.parse import urlsplit
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Публичный адрес вебхука целиком; путь из него же слушает локальный сервер.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookHandler:
+    """Accepts updates over HTTP and feeds them to the dispatcher in background tasks.
+
+    Telegram gets its 200 as soon as the update is parsed; at most
+    `max_concurrency` updates are processed at once, and a request waits for a
+    free slot before it is answered, so a slow bot pushes back on Telegram
+    instead of piling up tasks.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret: str, max_concurrency: int) -> None:
+        self._dispatcher = dispatcher
+        self._bot = bot
+        self._secret = secret
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._closing = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._closing:
+            # Telegram повторит доставку позже, уже следующему экземпляру.
+            return web.Response(status=503)
+        # Сравниваем байты: compare_digest не принимает str с не-ASCII символами.
+        received = request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+        if not hmac.compare_digest(received, self._secret.encode("utf-8")):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self._bot})
+        except (ValueError, ValidationError) as e:
+            logger.warning("Rejected malformed update: %s", e)
+            return web.Response(status=400)
+
+        await self._semaphore.acquire()
+        if self._closing:
+            self._semaphore.release()
+            return web.Response(status=503)
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self._dispatcher.feed_update(self._bot, update)
+        except Exception:
+            logger.exception("Failed to process update %s", update.update_id)
+        finally:
+            self._semaphore.release()
+
+    async def drain(self, timeout: float) -> None:
+        """Stop taking updates and wait for the ones in progress, cancelling them after `timeout`."""
+        self._closing = True
+        if not self._tasks:
+            return
+        logger.info("Draining %d updates in progress", len(self._tasks))
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.warning("Cancelling %d updates still running after %.0f s", len(pending), timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+handler_key = web.AppKey("webhook_handler", WebhookHandler)
+
+
+def create_app(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    secret: str = WEBHOOK_SECRET,
+    path: str | None = None,
+    max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+) -> web.Application:
+    """Build the aiohttp application that receives updates on `path`."""
+    handler = WebhookHandler(dispatcher, bot, secret, max_concurrency)
+    app = web.Application()
+    app[handler_key] = handler
+    app.router.add_post(path or urlsplit(WEBHOOK_URL).path or "/", handler.handle)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, allowed_updates: list[str] | None = None) -> None:
+    """Register the webhook, serve updates until SIGINT/SIGTERM, then drain and shut down."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL не установлен. Укажите публичный адрес вебхука в .env.")
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET не установлен. Без него вебхук принимал бы запросы от кого угодно.")
+
+    app = create_app(dispatcher, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    workflow_data = {"dispatcher": dispatcher, "bots": [bot], **dispatcher.workflow_data}
+    await dispatcher.emit_startup(bot=bot, **workflow_data)
+    try:
+        await site.start()
+        await bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates or dispatcher.resolve_used_update_types(),
+            max_connections=min(WEBHOOK_MAX_CONCURRENCY, 100),
+        )
+        logger.info("Serving webhook on %s:%d", WEBHOOK_HOST, WEBHOOK_PORT)
+        await stop.wait()
+    finally:
+        # Вебхук не снимаем: пока бот перезапускается, Telegram копит обновления у себя.
+        await app[handler_key].drain(WEBHOOK_DRAIN_TIMEOUT)
+        await runner.cleanup()
+        try:
+            await dispatcher.emit_shutdown(bot=bot, **workflow_data)
+        finally:
+            await bot.session.close()